@@ -0,0 +1,379 @@
+import json
+from flask import Blueprint, Response, abort, current_app, request, url_for
+from cache import response_cache
+from models import db, Venue, Artist
+from queries import (show_page, SHOW_WINDOWS, encode_cursor, decode_cursor,
+                     load_venue, load_artist, split_shows, venues_near, venues_within)
+
+try:
+    # Optional: several times faster than the json module, datetimes included.
+    import orjson
+except ImportError:
+    orjson = None
+
+
+#----------------------------------------------------------------------------#
+# JSON read API.
+#
+# Same data as the HTML pages, without template rendering. Every endpoint
+# takes ?fields=a,b,c to return a subset of fields (only those columns are
+# selected) and pages with ?limit= and a cursor.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = ('id', 'name', 'city', 'state', 'address', 'latitude', 'longitude', 'phone', 'genres', 'image_link',
+                'facebook_link', 'website', 'seeking_talent', 'seeking_description',
+                'upcoming_shows_count', 'past_shows_count', 'version')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+                 'facebook_link', 'website', 'seeking_venue', 'seeking_description',
+                 'upcoming_shows_count', 'past_shows_count', 'version')
+SHOW_FIELDS = ('id', 'start_time', 'end_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name',
+               'artist_image_link')
+DETAIL_SHOW_FIELDS = ('past_shows', 'upcoming_shows')
+
+
+def _default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def requested_fields(allowed):
+    if 'fields' not in request.args:
+        return allowed
+    fields = tuple(field for field in request.args['fields'].split(',') if field)
+    unknown = set(fields) - set(allowed)
+    if unknown or not fields:
+        abort(400, 'Unknown fields: {}'.format(', '.join(sorted(unknown))))
+    return fields
+
+
+def page_limit():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return min(max(limit, 1), current_app.config['API_PAGE_SIZE_MAX'])
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return json_response({'error': error.description}, status=error.code)
+
+
+#----------------------------------------------------------------------------#
+# Listings.
+#----------------------------------------------------------------------------#
+
+def _listing(model, allowed, endpoint):
+    fields = requested_fields(allowed)
+    limit = page_limit()
+    # id is always selected: it is the cursor.
+    columns = [model.id] + [getattr(model, field) for field in fields if field != 'id']
+    query = db.session.query(*columns).filter(model.listed()).order_by(model.id)
+    if 'after' in request.args:
+        query = query.filter(model.id > request.args.get('after', 0, type=int))
+    rows = query.limit(limit + 1).all()
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_url = url_for(endpoint, **dict(request.args.to_dict(), after=rows[-1].id))
+    return json_response({
+        'data': [{field: getattr(row, field) for field in fields} for row in rows],
+        'next': next_url
+    })
+
+
+@api.route('/venues')
+@response_cache.cached('venues')
+def venues():
+    """
+    List venues
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated subset of venue fields to return
+      - name: limit
+        in: query
+        type: integer
+        description: Page size
+      - name: after
+        in: query
+        type: integer
+        description: Return venues with an id greater than this (the cursor)
+    responses:
+      200:
+        description: A page of venues ordered by id, and the URL of the next page
+      400:
+        description: Unknown field requested
+    """
+    return _listing(Venue, VENUE_FIELDS, 'api.venues')
+
+
+@api.route('/artists')
+@response_cache.cached('artists')
+def artists():
+    """
+    List artists
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated subset of artist fields to return
+      - name: limit
+        in: query
+        type: integer
+        description: Page size
+      - name: after
+        in: query
+        type: integer
+        description: Return artists with an id greater than this (the cursor)
+    responses:
+      200:
+        description: A page of artists ordered by id, and the URL of the next page
+      400:
+        description: Unknown field requested
+    """
+    return _listing(Artist, ARTIST_FIELDS, 'api.artists')
+
+
+@api.route('/shows')
+@response_cache.cached('shows')
+def shows():
+    """
+    List shows
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: when
+        in: query
+        type: string
+        enum: [upcoming, past, all]
+        default: upcoming
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated subset of show fields to return
+      - name: limit
+        in: query
+        type: integer
+        description: Page size
+      - name: after
+        in: query
+        type: string
+        description: Cursor taken from the previous page's next URL
+    responses:
+      200:
+        description: A page of shows in start time order (newest first for past shows)
+      400:
+        description: Unknown field, window or cursor
+    """
+    fields = requested_fields(SHOW_FIELDS)
+    when = request.args.get('when', 'upcoming')
+    if when not in SHOW_WINDOWS:
+        abort(400, 'when must be one of {}'.format(', '.join(SHOW_WINDOWS)))
+    try:
+        after = decode_cursor(request.args['after']) if 'after' in request.args else None
+    except ValueError:
+        abort(400, 'Invalid cursor')
+    limit = page_limit()
+    rows = show_page(when, limit, after)
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_url = url_for('api.shows', **dict(request.args.to_dict(), after=encode_cursor(rows[-1])))
+    return json_response({
+        'data': [{field: getattr(row, field) for field in fields} for row in rows],
+        'next': next_url
+    })
+
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#
+# Not cached: every visitor asks about a different point.
+#----------------------------------------------------------------------------#
+
+NEARBY_FIELDS = ('id', 'name', 'city', 'state', 'address', 'latitude', 'longitude')
+
+
+def coordinate(name, low, high):
+    value = request.args.get(name, type=float)
+    if value is None or not low <= value <= high:
+        abort(400, '{} must be a number between {} and {}'.format(name, low, high))
+    return value
+
+
+def _nearby_response(rows):
+    return json_response({'data': [dict({field: getattr(row, field) for field in NEARBY_FIELDS},
+                                        distance_km=round(row.distance_km, 3)) for row in rows]})
+
+
+@api.route('/venues/nearby')
+def nearby_venues():
+    """
+    Venues within a radius of a point, nearest first
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: lat
+        in: query
+        type: number
+        required: true
+      - name: lng
+        in: query
+        type: number
+        required: true
+      - name: radius_km
+        in: query
+        type: number
+        default: 25
+      - name: limit
+        in: query
+        type: integer
+        description: Number of venues
+    responses:
+      200:
+        description: Venues with their distance from the point, in km
+      400:
+        description: Invalid point or radius
+    """
+    latitude = coordinate('lat', -90, 90)
+    longitude = coordinate('lng', -180, 180)
+    radius_km = request.args.get('radius_km', 25, type=float)
+    max_radius_km = current_app.config['NEARBY_MAX_RADIUS_KM']
+    if not 0 < radius_km <= max_radius_km:
+        abort(400, 'radius_km must be greater than 0 and at most {}'.format(max_radius_km))
+    return _nearby_response(venues_near(latitude, longitude, radius_km, page_limit()))
+
+
+@api.route('/venues/within')
+def venues_in_box():
+    """
+    Venues inside a bounding box, nearest to its center first
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: bbox
+        in: query
+        type: string
+        required: true
+        description: south,west,north,east in degrees; west > east crosses the antimeridian
+      - name: limit
+        in: query
+        type: integer
+        description: Number of venues
+    responses:
+      200:
+        description: Venues with their distance from the center of the box, in km
+      400:
+        description: Invalid box
+    """
+    try:
+        south, west, north, east = (float(value) for value in request.args.get('bbox', '').split(','))
+    except ValueError:
+        abort(400, 'bbox must be south,west,north,east')
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        abort(400, 'bbox is out of range')
+    return _nearby_response(venues_within(south, west, north, east, page_limit()))
+
+
+#----------------------------------------------------------------------------#
+# Details.
+#----------------------------------------------------------------------------#
+
+def _detail(model, loader, entity_id, allowed, counterpart):
+    fields = requested_fields(allowed + DETAIL_SHOW_FIELDS)
+    with_shows = any(field in DETAIL_SHOW_FIELDS for field in fields)
+    entity = loader(entity_id) if with_shows else model.query.filter(model.id == entity_id, model.listed()).first()
+    if entity is None:
+        abort(404, '{} {} not found'.format(model.__name__, entity_id))
+
+    data = {field: getattr(entity, field) for field in fields if field in allowed}
+    if with_shows:
+        past, upcoming = split_shows(entity.shows)
+        for field, shows in (('past_shows', past), ('upcoming_shows', upcoming)):
+            if field in fields:
+                data[field] = [{
+                    counterpart + '_id': getattr(show, counterpart + '_id'),
+                    counterpart + '_name': getattr(show, counterpart).name,
+                    counterpart + '_image_link': getattr(show, counterpart).image_link,
+                    'start_time': show.start_time,
+                    'end_time': show.end_time
+                } for show in shows]
+    return json_response(data)
+
+
+@api.route('/venues/<int:venue_id>')
+@response_cache.cached('venue:{venue_id}')
+def venue(venue_id):
+    """
+    Fetch a venue with its past and upcoming shows
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: venue_id
+        in: path
+        type: integer
+        required: true
+        description: Id of the Venue
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated subset of venue fields, past_shows and upcoming_shows
+    responses:
+      200:
+        description: Venue information with past and upcoming shows
+      404:
+        description: No such venue
+    """
+    return _detail(Venue, load_venue, venue_id, VENUE_FIELDS, 'artist')
+
+
+@api.route('/artists/<int:artist_id>')
+@response_cache.cached('artist:{artist_id}')
+def artist(artist_id):
+    """
+    Fetch an artist with their past and upcoming shows
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: artist_id
+        in: path
+        type: integer
+        required: true
+        description: Id of the Artist
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated subset of artist fields, past_shows and upcoming_shows
+    responses:
+      200:
+        description: Artist information with past and upcoming shows
+      404:
+        description: No such artist
+    """
+    return _detail(Artist, load_artist, artist_id, ARTIST_FIELDS, 'venue')
@@ -4,142 +4,207 @@
 
 import sys
 import json
-import dateutil.parser
-import babel
+from datetime import timedelta
 from flask import (
+Blueprint,
 Flask, 
+current_app,
 render_template, 
 request, 
 Response, 
 flash, 
 redirect, 
-url_for)
-import logging
-from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-from models import *
-from flask_migrate import Migrate
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-from flasgger import Swagger
+url_for,
+abort,
+stream_with_context)
+from forms import ArtistForm, ShowForm, VenueForm
+from models import db, moment, Venue, Artist, Show
+from config import Config, instance_secret_key
+from formatting import format_datetime, to_datetime
+from queries import venue_areas, genre_filter, genre_counts, GENRE_MATCHES, search, show_page, SHOW_WINDOWS, encode_cursor, decode_cursor, load_venue, load_artist, split_shows, booking_conflict, show_conflicts
+import counters
+from cache import response_cache, venue_tags, artist_tags, show_tags
+from api import api
+from calendars import calendars
+from importer import imports, import_command
+from exporter import exports, export_command
+from updates import updates
+from plans import check_plans_command
+from logs import log_pipeline
+from instrumentation import instrumentation
+from profiler import profiler
+from templating import templates
+from assets import assets
+from geocoding import gazetteer
+from purge import remove_venue, purge_command
 
 #----------------------------------------------------------------------------#
 # App Config.
+#
+# Nothing is set up at import time: create_app() builds the app. Under a
+# preforking server build it once, in the master (gunicorn --preload
+# 'app:create_app()'): templates are compiled and the API spec generated
+# before the fork, and the workers share that memory. No database connection
+# is opened here, each worker opens its own.
 #----------------------------------------------------------------------------#
 
-Swagger (app)
+pages = Blueprint('pages', __name__)
+
+def create_app(config=Config):
+  app = Flask(__name__)
+  app.config.from_object(config)
+  if not app.config['SECRET_KEY']:
+    app.config['SECRET_KEY'] = instance_secret_key(app.instance_path)
+  moment.init_app(app)
+  db.init_app(app)
+  init_migrate(app)
+  app.cli.add_command(counters.cli)
+  response_cache.init_app(app)
+  app.register_blueprint(pages)
+  app.register_blueprint(api)
+  app.register_blueprint(calendars)
+  app.register_blueprint(imports)
+  app.cli.add_command(import_command)
+  app.register_blueprint(exports)
+  app.cli.add_command(export_command)
+  app.register_blueprint(updates)
+  app.cli.add_command(check_plans_command)
+  app.cli.add_command(purge_command)
+  gazetteer.init_app(app)
+  log_pipeline.init_app(app)
+  instrumentation.init_app(app)
+  profiler.init_app(app)
+  assets.init_app(app)
+  init_swagger(app)
+  app.jinja_env.filters['datetime'] = format_datetime
+  templates.init_app(app)
+  return app
+
+def init_migrate(app):
+  # Alembic is only used by the `flask db` commands, which import
+  # flask_migrate before they create the app; the web workers never load it.
+  flask_migrate = sys.modules.get('flask_migrate')
+  if flask_migrate is not None:
+    flask_migrate.Migrate(app, db)
+
+def init_swagger(app):
+  # Once every route is registered. flasgger keeps the spec it generates
+  # outside debug mode, so it is generated here rather than by a worker.
+  if not app.config['SWAGGER_ENABLED']:
+    return
+  from flasgger import Swagger
+  swagger = Swagger(app)
+  if not app.debug:
+    with app.test_request_context():
+      for spec in swagger.config['specs']:
+        swagger.get_apispecs(spec['endpoint'])
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
-app.jinja_env.filters['datetime'] = format_datetime
+def stream_template(template_name, **context):
+  app = current_app._get_current_object()
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(current_app.config['TEMPLATE_STREAM_BUFFER'])
+  return stream
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@pages.route('/')
 def index():
   return render_template('pages/home.html')
 
+def genre_args():
+  # ?genre=Jazz&genre=Blues&match=any|all
+  genres = sorted(set(request.args.getlist('genre')))
+  match = request.args.get('match', 'any')
+  if match not in GENRE_MATCHES:
+    abort(400)
+  return genres, match
+
+def genre_facets(model, genres, match):
+  # Drill-down links: each facet adds its genre to the filter, or removes it
+  # when already selected.
+  counts = dict(genre_counts(model, genres, match))
+  facets = [{
+    'genre': genre,
+    'count': count,
+    'selected': genre in genres,
+    'url': url_for(request.endpoint, genre=sorted(set(genres) ^ {genre}), match=match)
+  } for genre, count in counts.items()]
+  return facets + [{
+    'genre': genre,
+    'count': 0,
+    'selected': True,
+    'url': url_for(request.endpoint, genre=[g for g in genres if g != genre], match=match)
+  } for genre in genres if genre not in counts]
+
 #----------------------------------------------------------------------------#
 #  Venues
 #----------------------------------------------------------------------------#
 
-@app.route('/venues')
+@pages.route('/venues')
+@response_cache.cached('venues')
 def venues():
-  data = []
-  venues = Venue.query.all()
-  for place in Venue.query.distinct(Venue.city, Venue.state).all():
-      data.append({
-          'city': place.city,
-          'state': place.state,
-          'venues': [{
-              'id': venue.id,
-              'name': venue.name,
-          } for venue in venues if
-              venue.city == place.city and venue.state == place.state]
-      })
-  return render_template('pages/venues.html', areas=data)
-
-@app.route('/venues/search', methods=['POST'])
+  page = max(request.args.get('page', 1, type=int), 1)
+  genres, match = genre_args()
+  per_area = current_app.config['VENUES_PER_AREA']
+  data = venue_areas(per_area,
+                     page=page,
+                     city=request.args.get('city'),
+                     state=request.args.get('state'),
+                     genres=genres,
+                     match=match)
+  return render_template('pages/venues.html', areas=data, genres=genres, match=match,
+                         facets=genre_facets(Venue, genres, match))
+
+@pages.route('/venues/search', methods=['POST'])
 def search_venues():
-  data=[]
-  match=0
   search_term = request.form.get('search_term', '')
-  venues=Venue.query.all()
-  for venue in venues:
-    if venue.name.lower().find(search_term.lower()) != -1:
-      match=match+1
-      match_venue={
-        'id': venue.id,
-        'name': venue.name,
-        'num_upcoming_show': Show.query.filter(Show.venue_id == venue.id, Show.start_time >= datetime.now()).count()
-      }
-      data.append(match_venue)
+  limit = current_app.config['SEARCH_RESULTS_LIMIT']
+  offset = max(request.form.get('offset', 0, type=int), 0)
+  matches = search(Venue, search_term, limit, offset)
+  data = [{
+    'id': venue.id,
+    'name': venue.name,
+    'num_upcoming_show': venue.upcoming_shows_count
+  } for venue in matches]
   response={
-    "count": match,
-    "data": data
+    "count": matches[0].total if matches else 0,
+    "data": data,
+    "offset": offset,
+    "limit": limit
   }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
-@app.route('/venues/<int:venue_id>')
+@pages.route('/venues/<int:venue_id>')
+@response_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
-  """
-  This is Fyuur API GET method to fetch information of a particular Venue
-  Call this Method passing the venue id within the URI
-  ---
-  tags:
-    - Fyuur API
-  parameters:
-    - venue_id: venue_id
-      in: path
-      type: Integer
-      required: true
-      description: Id of the Venue
-  responses:
-    Good Response:
-      description: Venue Information with Past and Upcoming Shows
-    500:
-      description: Something went wrong!
-  """
-  venue=Venue.query.filter(Venue.id == venue_id).first()
-  venue_past_shows = []
-  venue_upcm_shows = []
-
-  past_shows = Show.query.join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time < datetime.now()).all()
-  for show in past_shows:
-    venue_past_shows.append({
+  venue = load_venue(venue_id)
+  if venue is None:
+    abort(404)
+  past_shows, upcm_shows = split_shows(venue.shows)
+  venue_past_shows = [{
         "artist_id": show.artist_id,
         "artist_name": show.artist.name,
         "artist_image_link": show.artist.image_link,
-        "start_time": format_datetime(str(show.start_time))
-    })
-
-  upcm_shows = Show.query.join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time >= datetime.now()).all()
-  for show in upcm_shows:    
-    venue_upcm_shows.append({
+        "start_time": show.start_time
+    } for show in past_shows]
+  venue_upcm_shows = [{
         "artist_id": show.artist_id,
         "artist_name": show.artist.name,
         "artist_image_link": show.artist.image_link,
-        "start_time": format_datetime(str(show.start_time))
-    })
+        "start_time": show.start_time
+    } for show in upcm_shows]
 
   data = {
         'id': venue.id,
         'name': venue.name,
-        'genres': [],
+        'genres': venue.genres or [],
         'address': venue.address,
         'city': venue.city,
         'state': venue.state,
@@ -149,8 +214,8 @@ def show_venue(venue_id):
         'website': venue.website,
         'seeking_talent': venue.seeking_talent,
         'seeking_description': venue.seeking_description,
-        'past_shows_count': len(venue_past_shows),
-        'upcoming_shows_count': len(venue_upcm_shows),
+        'past_shows_count': venue.past_shows_count,
+        'upcoming_shows_count': venue.upcoming_shows_count,
         'past_shows': venue_past_shows,
         'upcoming_shows': venue_upcm_shows
       }
@@ -160,12 +225,12 @@ def show_venue(venue_id):
 #  Create Venue                                                   #
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@pages.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@pages.route('/venues/create', methods=['POST'])
 def create_venue_submission():  
   name           = request.form['name']
   city           = request.form['city']
@@ -184,10 +249,13 @@ def create_venue_submission():
       st_flag=False 
       seeking_description = None
 
+    latitude, longitude = gazetteer.locate(city, state)
     venue = Venue(name=name, 
                   city=city, 
                   state=state, 
                   address=address, 
+                  latitude=latitude,
+                  longitude=longitude,
                   phone=phone, 
                   genres=genres,
                   facebook_link=facebook_link,
@@ -196,29 +264,31 @@ def create_venue_submission():
                   seeking_description=seeking_description)
     db.session.add(venue)
     db.session.commit()
+    response_cache.invalidate('venues')
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  except Exception as e:
+  except Exception:
       db.session.rollback()
-      print(f'Error ==> {e}')
-      print(sys.exc_info())
+      current_app.logger.exception('Venue could not be created')
       flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
   finally:
       db.session.close()
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@pages.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # Implemented as a controller and not in view, tested using POSTMAN.
-  # Table Venue was updated to have cascade="all, delete-orphan" so that if there are any shows at that venue, those are also deleted
-  # Delete was not working without cascade.
+  # The venue's shows go with it: see purge.py.
   try:
-    venue = Venue.query.filter(Venue.id == venue_id).first()
-    db.session.delete(venue)
+    venue = Venue.query.filter(Venue.id == venue_id, Venue.listed()).first()
+    # Its artists' counters change too
+    stale = venue_tags(venue.id) + ['artists']
+    remove_venue(venue.id, soft=current_app.config['SOFT_DELETE'])
     db.session.commit()
+    response_cache.invalidate(*stale)
     flash('Venue ' + venue.name + ' was deleted!')
   except:
     db.session.rollback()
-    print(sys.exc_info())
+    current_app.logger.exception('Venue %s could not be deleted', venue_id)
     flash('An error occured. Venue ' + venue.name + ' could not be deleted')
   finally:
     db.session.close()
@@ -227,85 +297,66 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@pages.route('/artists')
+@response_cache.cached('artists')
 def artists():
+  genres, match = genre_args()
   data=[]
-  all_artists=Artist.query.all()
-  for sp_artist in all_artists:
+  query=Artist.query
+  if genres:
+    query=query.filter(genre_filter(Artist, genres, match))
+  for sp_artist in query.all():
     artist_info={
       'id': sp_artist.id,
       'name': sp_artist.name
     }
     data.append(artist_info)
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, genres=genres, match=match,
+                         facets=genre_facets(Artist, genres, match))
 
-@app.route('/artists/search', methods=['POST'])
+@pages.route('/artists/search', methods=['POST'])
 def search_artists():
-  data=[]
-  match=0
   search_term = request.form.get('search_term', '')
-  artists=Artist.query.all()
-  for artist in artists:
-    if artist.name.lower().find(search_term.lower()) != -1:
-      match=match+1
-      match_artist={
-        'id': artist.id,
-        'name': artist.name,
-        'num_upcoming_show': Show.query.filter(Show.artist_id == artist.id, Show.start_time >= datetime.now()).count()
-      }
-      data.append(match_artist)
+  limit = current_app.config['SEARCH_RESULTS_LIMIT']
+  offset = max(request.form.get('offset', 0, type=int), 0)
+  matches = search(Artist, search_term, limit, offset)
+  data = [{
+    'id': artist.id,
+    'name': artist.name,
+    'num_upcoming_show': artist.upcoming_shows_count
+  } for artist in matches]
   response={
-    "count": match,
-    "data": data
+    "count": matches[0].total if matches else 0,
+    "data": data,
+    "offset": offset,
+    "limit": limit
   }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
-@app.route('/artists/<int:artist_id>')
+@pages.route('/artists/<int:artist_id>')
+@response_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
-  """
-  This is Fyuur API GET method to fetch information of a particular Artist
-  Call this Method passing the artit id within the URI
-  ---
-  tags:
-    - Fyuur API
-  parameters:
-    - venue_id: artist_id
-      in: path
-      type: Integer
-      required: true
-      description: Id of the Artist
-  responses:
-    Good Response:
-      description: Artist Information with Past and Upcoming Shows
-    500:
-      description: Something went wrong!
-  """
-  artist=Artist.query.filter(Artist.id == artist_id).first()
-  artist_past_shows = []
-  artist_upcm_shows = []
-
-  past_shows = Show.query.join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time < datetime.now()).all()
-  for show in past_shows:
-    artist_past_shows.append({
+  artist = load_artist(artist_id)
+  if artist is None:
+    abort(404)
+  past_shows, upcm_shows = split_shows(artist.shows)
+  artist_past_shows = [{
     "venue_id": show.venue_id,
     "venue_name": show.venue.name,
     "venue_image_link": show.venue.image_link,
-    "start_time": format_datetime(str(show.start_time))
-  })
-
-  upcm_shows = Show.query.join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time >= datetime.now()).all()
-  for show in upcm_shows:
-    artist_past_shows.append({
+    "start_time": show.start_time
+  } for show in past_shows]
+  artist_upcm_shows = [{
     "venue_id": show.venue_id,
     "venue_name": show.venue.name,
     "venue_image_link": show.venue.image_link,
-    "start_time": format_datetime(str(show.start_time))
-  })
-  
+    "start_time": show.start_time
+  } for show in upcm_shows]
+
   data = {
         'id': artist.id,
         'name': artist.name,
-        'genres': [],
+        'genres': artist.genres or [],
         'city': artist.city,
         'state': artist.state,
         'phone': artist.phone,
@@ -315,8 +366,8 @@ def show_artist(artist_id):
         'website': artist.website,
         'seeking_venue': artist.seeking_venue,
         'seeking_description': artist.seeking_description,
-        'past_shows_count': len(artist_past_shows),
-        'upcoming_shows_count': len(artist_upcm_shows),
+        'past_shows_count': artist.past_shows_count,
+        'upcoming_shows_count': artist.upcoming_shows_count,
         'past_shows': artist_past_shows,
         'upcoming_shows': artist_upcm_shows
       }
@@ -325,7 +376,7 @@ def show_artist(artist_id):
 #----------------------------------------------------------------------------#
 #  Update
 #----------------------------------------------------------------------------#
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@pages.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
   edit_artist = Artist.query.filter(Artist.id == artist_id).first()
@@ -344,7 +395,7 @@ def edit_artist(artist_id):
   }
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@pages.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # This is an implementation of artist information edit form. It's optional and hence not been implemented in view.
   # This functionality has been tested with POSTMAN 
@@ -361,19 +412,22 @@ def edit_artist_submission(artist_id):
       artist.seeking_venue  = request.form['seeking_venue']
       artist.seeking_description  = request.form['seeking_description']
       db.session.commit()
+      response_cache.invalidate(*artist_tags(artist_id))
       flash('Artist ' + request.form['name'] + ' was successfully updated!')
     except:
       db.session.rollback()
-      print(sys.exc_info())
+      current_app.logger.exception('Artist %s could not be updated', artist_id)
       flash('An error occurred. Artist ' + request.form['name'] + ' could not be updated.')
     finally:
       db.session.close()
-      return redirect(url_for('show_artist', artist_id=artist_id))
+      return redirect(url_for('.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@pages.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  edit_venue = Venue.query.filter(Venue.id == venue_id).first()
+  edit_venue = Venue.query.filter(Venue.id == venue_id, Venue.listed()).first()
+  if edit_venue is None:
+    abort(404)
   venue={
     "id": edit_venue.id,
     "name": edit_venue.name,
@@ -389,16 +443,17 @@ def edit_venue(venue_id):
   }
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@pages.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # This is an implementation of venue information edit form. It's optional and hence not been implemented in view.
   # This functionality has been tested with POSTMAN 
-    venue = Venue.query.filter(Venue.id == venue_id).first()
+    venue = Venue.query.filter(Venue.id == venue_id, Venue.listed()).first()
     try:
       venue.name           = request.form['name']
       venue.city           = request.form['city']
       venue.state          = request.form['state']
       venue.address        = request.form['address']
+      venue.latitude, venue.longitude = gazetteer.locate(venue.city, venue.state)
       venue.phone          = request.form['phone']
       venue.genres         = request.form.getlist('genres')
       venue.facebook_link  = request.form['facebook_link']
@@ -406,25 +461,26 @@ def edit_venue_submission(venue_id):
       venue.seeking_venue  = request.form['seeking_talent']
       venue.seeking_description  = request.form['seeking_description']
       db.session.commit()
+      response_cache.invalidate(*venue_tags(venue_id))
       flash('Venue ' + request.form['name'] + ' was successfully updated!')
     except:
       db.session.rollback()
-      print(sys.exc_info())
+      current_app.logger.exception('Venue %s could not be updated', venue_id)
       flash('An error occurred. Venue ' + request.form['name'] + ' could not be updated.')
     finally:
       db.session.close()
-      return redirect(url_for('show_venue', venue_id=venue_id))
+      return redirect(url_for('.show_venue', venue_id=venue_id))
 
 #----------------------------------------------------------------------------#
 #  Create Artist
 #----------------------------------------------------------------------------#
 
-@app.route('/artists/create', methods=['GET'])
+@pages.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@pages.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     name           = request.form['name']
     city           = request.form['city']
@@ -453,10 +509,11 @@ def create_artist_submission():
                     seeking_description=seeking_description)
       db.session.add(artist)
       db.session.commit()
+      response_cache.invalidate('artists')
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
     except:
         db.session.rollback()
-        print(sys.exc_info())
+        current_app.logger.exception('Artist could not be created')
         flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed.')
     finally:
         db.session.close()
@@ -466,86 +523,124 @@ def create_artist_submission():
 #  Shows
 #----------------------------------------------------------------------------#
 
-@app.route('/shows')
+@pages.route('/shows')
+@response_cache.cached('shows')
 def shows():
-  shows=Show.query.join(Artist).join(Venue).all()
-  data=[]
-  for show in shows:
-      sp_show={
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": format_datetime(str(show.start_time))
-      }
-      data.append(sp_show)
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/create')
+  when = request.args.get('when', 'upcoming')
+  if when not in SHOW_WINDOWS:
+    abort(400)
+  try:
+    after = decode_cursor(request.args['after']) if 'after' in request.args else None
+  except ValueError:
+    abort(400)
+  limit = current_app.config['SHOWS_PER_PAGE']
+  rows = show_page(when, limit, after)
+  next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+
+  # Rows are turned into tiles lazily while the template streams, so the
+  # first tiles go out before the rest of the page is rendered.
+  data = ({
+    "id": show.id,
+    "venue_id": show.venue_id,
+    "venue_name": show.venue_name,
+    "artist_id": show.artist_id,
+    "artist_name": show.artist_name,
+    "artist_image_link": show.artist_image_link,
+    "start_time": show.start_time,
+    "updated_at": show.updated_at,
+    "venue_updated_at": show.venue_updated_at,
+    "artist_updated_at": show.artist_updated_at
+  } for show in rows[:limit])
+  return Response(stream_with_context(
+    stream_template('pages/shows.html', shows=data, when=when, next_cursor=next_cursor)))
+
+@pages.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@pages.route('/shows/create', methods=['POST'])
 def create_show_submission():
   artist_id      = request.form['artist_id']
   venue_id       = request.form['venue_id']
   start_time     = request.form['start_time']
+  duration       = request.form.get('duration', ShowForm.duration.kwargs['default'], type=int)
+  form           = ShowForm()
+  if not form.duration.validate(form):
+    flash('Duration: ' + form.duration.errors[-1])
+    return render_template('forms/new_show.html', form=form), 400
   try:
+    start_time = to_datetime(start_time)
+    end_time = start_time + timedelta(minutes=duration)
+    # Locked until the commit, so that the venue isn't deleted meanwhile.
+    if db.session.query(Venue.id).filter(Venue.id == venue_id, Venue.listed()).with_for_update(read=True).first() is None:
+      raise LookupError('Venue {} not found'.format(venue_id))
     show = Show(artist_id=artist_id, 
                 venue_id=venue_id, 
-                start_time=start_time) 
+                start_time=start_time,
+                end_time=end_time) 
     db.session.add(show)
+    db.session.flush()
+    counters.record_show(show.id)
     db.session.commit()
+    response_cache.invalidate(*show_tags(venue_id, artist_id))
     flash('Show was successfully listed!')
-  except:
+  except Exception as e:
     db.session.rollback()
-    print(sys.exc_info())
-    flash('An error occurred. Show could not be listed.')
+    conflict = booking_conflict(e)
+    if conflict is None:
+      current_app.logger.exception('Show could not be created')
+      flash('An error occurred. Show could not be listed.')
+    else:
+      # Back to the form, with the shows it collides with.
+      for message in booking_messages(conflict, int(venue_id), int(artist_id), start_time, end_time):
+        flash(message)
+      return render_template('forms/new_show.html', form=form), 409
   finally:
     db.session.close()
-    return render_template('pages/home.html')
+  return render_template('pages/home.html')
 
-@app.errorhandler(400)
+def booking_messages(conflict, venue_id, artist_id, start_time, end_time):
+  # One line per show the new one would overlap.
+  messages = []
+  for show in show_conflicts(venue_id, artist_id, start_time, end_time):
+    if show.venue_id == venue_id:
+      booked, detail = show.venue_name, show.artist_name
+    else:
+      booked, detail = show.artist_name, 'at ' + show.venue_name
+    messages.append('{} is already booked from {} to {} ({}).'.format(
+      booked, format_datetime(show.start_time), format_datetime(show.end_time), detail))
+  return messages or ['The {} is already booked at that time.'.format(conflict)]
+
+@pages.app_errorhandler(400)
 def bad_request(error):
     return render_template('errors/400.html'), 400
 
-@app.errorhandler(401)
+@pages.app_errorhandler(401)
 def unauthorized(error):
     return render_template('errors/401.html'), 401
 
-@app.errorhandler(404)
+@pages.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@pages.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
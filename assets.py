@@ -0,0 +1,242 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import click
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+from flask.cli import with_appcontext
+
+try:
+    # Optional: brotli variants are skipped without it.
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    # Optional: JS bundles are only concatenated without it.
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+#----------------------------------------------------------------------------#
+# Static asset pipeline.
+#
+# `flask build-assets` concatenates and minifies the BUNDLES, writes them to
+# static/dist/ under a content hash (main.3f2a9c81d0e4.css) along with .gz and
+# .br variants, and records the names in static/dist/manifest.json. Templates
+# call asset_urls('main.css'): the hashed URL once built, the source files
+# otherwise (development). Hashed files never change, so /assets/ serves them
+# precompressed with a one year, immutable cache lifetime.
+#
+# Relative url()s in the stylesheets are rebased onto /static/, where the
+# fonts and images they point to are served.
+#----------------------------------------------------------------------------#
+
+BUNDLES = {
+    'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                 'css/main.responsive.css', 'css/main.quickfix.css'],
+    # Needed while the page renders.
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    # Deferred, after jQuery.
+    'main.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+MAX_AGE = 365 * 24 * 3600
+
+# Smaller variants first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.MULTILINE)
+
+
+# A comment or a quoted string.
+CSS_TOKEN = re.compile(r'/\*.*?\*/|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'', re.DOTALL)
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]*)\1\s*\)')
+
+
+def _squeeze(css):
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}')
+
+
+def minify_css(css):
+    # Conservative: comments and whitespace only, strings left alone.
+    parts, position = [], 0
+    for match in CSS_TOKEN.finditer(css):
+        parts.append(_squeeze(css[position:match.start()]))
+        # /*! licences are kept
+        if not match.group().startswith('/*') or match.group().startswith('/*!'):
+            parts.append(match.group())
+        position = match.end()
+    parts.append(_squeeze(css[position:]))
+    return ''.join(parts).strip()
+
+
+def rebase_urls(css, source, static_url):
+    # Relative url()s of the stylesheet at `source` (relative to the static
+    # folder) made absolute, for a bundle served from elsewhere.
+    base = posixpath.dirname(source)
+
+    def rebase(match):
+        quote, url = match.group(1), match.group(2).strip()
+        if not url or url.startswith(('/', '#')) or re.match(r'[a-z][a-z0-9+.-]*:', url, re.IGNORECASE):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        return 'url({0}{1}/{2}{3}{0})'.format(quote, static_url.rstrip('/'),
+                                              posixpath.normpath(posixpath.join(base, path)), suffix)
+    return CSS_URL.sub(rebase, css)
+
+
+def minify_js(js):
+    return rjsmin.jsmin(js) if rjsmin is not None else js
+
+
+def bundle(static_folder, name, sources, static_url='/static'):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            parts.append(SOURCE_MAP.sub('', f.read()))
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(rebase_urls(part, source, static_url)) for part, source in zip(parts, sources))
+    # A file without a trailing semicolon must not run into the next one.
+    return ';\n'.join(minify_js(part).strip() for part in parts) + ';\n'
+
+
+def hashed_name(name, content):
+    root, ext = os.path.splitext(name)
+    return '{}.{}{}'.format(root, hashlib.sha256(content).hexdigest()[:12], ext)
+
+
+def write_variants(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    # mtime=0: identical input, identical .gz.
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(content, quality=11))
+
+
+def read_manifest(dist):
+    try:
+        with open(os.path.join(dist, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build(static_folder, bundles=BUNDLES, static_url='/static'):
+    # Returns the new manifest. Files of the previous build are kept, for
+    # pages still referencing them during a deploy; older ones are removed.
+    dist = os.path.join(static_folder, DIST)
+    os.makedirs(dist, exist_ok=True)
+    previous = read_manifest(dist)
+    manifest = {}
+    for name, sources in sorted(bundles.items()):
+        content = bundle(static_folder, name, sources, static_url).encode('utf-8')
+        manifest[name] = hashed_name(name, content)
+        write_variants(os.path.join(dist, manifest[name]), content)
+
+    keep = set(manifest.values()) | set(previous.values())
+    for entry in os.scandir(dist):
+        base = re.sub(r'\.(gz|br)$', '', entry.name)
+        if entry.name != MANIFEST and base not in keep:
+            os.remove(entry.path)
+
+    tmp = os.path.join(dist, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(dist, MANIFEST))
+    return manifest
+
+
+#----------------------------------------------------------------------------#
+# Serving.
+#----------------------------------------------------------------------------#
+
+class Assets(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        self._manifest = None
+        self._manifest_mtime = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.register_blueprint(blueprint)
+        app.add_template_global(self.asset_urls)
+        app.cli.add_command(build_command)
+
+    @property
+    def dist(self):
+        return os.path.join(self.app.static_folder, DIST)
+
+    def manifest(self):
+        # Re-read after a build, without restarting.
+        try:
+            mtime = os.stat(os.path.join(self.dist, MANIFEST)).st_mtime
+        except OSError:
+            return {}
+        if mtime != self._manifest_mtime:
+            self._manifest = read_manifest(self.dist)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def asset_urls(self, name):
+        hashed = self.manifest().get(name)
+        if hashed is not None:
+            return [url_for('assets.asset', filename=hashed)]
+        return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+assets = Assets()
+
+blueprint = Blueprint('assets', __name__)
+
+
+@blueprint.route('/assets/<filename>')
+def asset(filename):
+    if filename == MANIFEST or filename.endswith(('.gz', '.br', '.tmp')):
+        abort(404)
+    path = os.path.join(assets.dist, filename)
+    if not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.isfile(path + suffix):
+            response = send_file(path + suffix, mimetype=mimetype, conditional=True, cache_timeout=MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True, cache_timeout=MAX_AGE)
+    response.cache_control.immutable = True
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_command():
+    """Bundle, minify, fingerprint and precompress the static assets."""
+    manifest = build(current_app.static_folder, static_url=current_app.static_url_path)
+    dist = os.path.join(current_app.static_folder, DIST)
+    for name, hashed in sorted(manifest.items()):
+        sizes = [os.path.getsize(os.path.join(dist, hashed + suffix))
+                 for suffix in ('', '.gz', '.br') if os.path.exists(os.path.join(dist, hashed + suffix))]
+        click.echo('{:<10} {:<28} {}'.format(name, hashed, ' / '.join('{:,} B'.format(size) for size in sizes)))
+    if brotli is None:
+        click.echo('brotli is not installed: no .br variants.', err=True)
@@ -0,0 +1,25 @@
+import hmac
+from functools import wraps
+from flask import abort, current_app, request
+
+
+#----------------------------------------------------------------------------#
+# Admin endpoints.
+#
+# The /admin endpoints, and the ones that read or write the catalog in bulk,
+# are for the operators only: they take the ADMIN_TOKEN in an X-Admin-Token
+# header. Without a configured token they are unreachable.
+#----------------------------------------------------------------------------#
+
+ADMIN_HEADER = 'X-Admin-Token'
+
+
+def admin_required(view):
+    # Requires the ADMIN_TOKEN in the X-Admin-Token header, or answers 401.
+    @wraps(view)
+    def wrapper(**kwargs):
+        token = current_app.config.get('ADMIN_TOKEN')
+        if not token or not hmac.compare_digest(request.headers.get(ADMIN_HEADER, ''), token):
+            abort(401)
+        return view(**kwargs)
+    return wrapper
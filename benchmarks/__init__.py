@@ -0,0 +1,10 @@
+# Performance benchmarks for Fyyur. Run a module with `python -m benchmarks.<name>`.
+import subprocess
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
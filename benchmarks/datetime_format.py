@@ -0,0 +1,62 @@
+"""Per-call cost of the `datetime` filter, before and after formatting.py.
+
+    python -m benchmarks.datetime_format [--calls 20000] [--distinct 500]
+
+"before" is the original app.format_datetime: str() the datetime, parse it
+back with dateutil and hand babel a pattern string. "after" is
+formatting.format_datetime fed the native datetime, with its memo cache
+cleared before each run so only `--distinct` timestamps are ever formatted.
+"""
+import argparse
+import timeit
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+import formatting
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=500,
+                        help='distinct timestamps among the calls')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    start = datetime(2026, 1, 1, 20, 0)
+    values = [start + timedelta(hours=i % args.distinct) for i in range(args.calls)]
+
+    def before():
+        for value in values:
+            legacy_format_datetime(str(value), 'full')
+
+    def after():
+        formatting._format.cache_clear()
+        for value in values:
+            formatting.format_datetime(value, 'full')
+
+    def after_uncached():
+        # Every call misses the memo cache: only the precompiled pattern helps.
+        for value in values:
+            formatting._format.__wrapped__(value, 'full', 'en')
+
+    for value in values[:args.distinct]:
+        assert legacy_format_datetime(str(value), 'full') == formatting.format_datetime(value, 'full')
+
+    print('{} calls, {} distinct timestamps, best of {}'.format(args.calls, args.distinct, args.repeat))
+    for name, func in (('before', before), ('after (no memo)', after_uncached), ('after', after)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('{:<16} {:>9.2f} us/call'.format(name, best / args.calls * 1e6))
+
+
+if __name__ == '__main__':
+    main()
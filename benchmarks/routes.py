@@ -0,0 +1,316 @@
+"""Latency, throughput, SQL and memory cost of every route in the app.
+
+    python -m benchmarks.routes [--requests 50] [--concurrency 1] [--writes]
+                                [--cache] [--only SUBSTRING] [--url URL]
+                                [--output results.json] [--compare old.json]
+
+Drives each route through the Flask test client (or, with --url, over HTTP
+against a running server) and reports per route: throughput, p50/p95/p99
+latency, SQL statements per request and the peak memory allocated while
+serving one request. Ids and filters come from the data in the database, so
+seed it first (python -m benchmarks.seed). Write routes only run with
+--writes; they add and edit rows. The response cache is disabled unless
+--cache is given, otherwise only cache hits would be measured.
+
+--output writes the results as JSON; --compare prints the latency and SQL
+changes against an earlier --output file.
+"""
+import argparse
+import itertools
+import json
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import create_app
+from benchmarks import git_revision
+from cache import response_cache
+from models import db, Venue, Artist, Show
+from plans import sample_arguments
+
+app = create_app()
+
+# Endpoints that are not part of the app proper.
+SKIPPED_ENDPOINTS = ('static', 'flasgger.static', 'flasgger.apidocs', 'flasgger.<lambda>',
+                     'cache_stats', 'pages.delete_venue', 'imports.import_upload',
+                     'exports.export_download', 'updates.update_venues', 'updates.update_artists')
+
+_statements = threading.local()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    _statements.count = getattr(_statements, 'count', 0) + 1
+
+
+def venue_form(name):
+    return {
+        'name': name, 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+        'phone': '123-123-1234', 'genres': ['Jazz', 'Funk'], 'facebook_link': 'https://www.facebook.com/x',
+        'website': 'https://example.com', 'seeking_talent': 'Yes', 'seeking_description': 'Bands',
+    }
+
+
+def artist_form(name):
+    form = venue_form(name)
+    del form['seeking_talent']
+    form['seeking_venue'] = 'Yes'
+    return form
+
+
+def show_form(args):
+    # A later slot on every call: booking the same one twice is rejected.
+    # Runs start from a different slot, far in the future.
+    slots = itertools.count(int(time.time()) % 1000000)
+
+    def form():
+        start_time = datetime(2030, 1, 1, 20) + next(slots) * timedelta(hours=3)
+        return {'venue_id': args['venue_id'], 'artist_id': args['artist_id'],
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+    return form
+
+
+def scenarios(args, writes=False):
+    # {endpoint: (method, url, form)} for every route of the app. form may
+    # be a function returning a new form for every request.
+    reads = {
+        'pages.index': ('GET', '/', None),
+        'pages.venues': ('GET', '/venues', None),
+        'pages.search_venues': ('POST', '/venues/search', {'search_term': 'hall'}),
+        'pages.show_venue': ('GET', '/venues/{venue_id}'.format(**args), None),
+        'pages.create_venue_form': ('GET', '/venues/create', None),
+        'pages.edit_venue': ('GET', '/venues/{venue_id}/edit'.format(**args), None),
+        'pages.artists': ('GET', '/artists', None),
+        'pages.search_artists': ('POST', '/artists/search', {'search_term': 'band'}),
+        'pages.show_artist': ('GET', '/artists/{artist_id}'.format(**args), None),
+        'pages.create_artist_form': ('GET', '/artists/create', None),
+        'pages.edit_artist': ('GET', '/artists/{artist_id}/edit'.format(**args), None),
+        'pages.shows': ('GET', '/shows', None),
+        'pages.create_shows': ('GET', '/shows/create', None),
+        'api.venues': ('GET', '/api/v1/venues', None),
+        'api.venue': ('GET', '/api/v1/venues/{venue_id}'.format(**args), None),
+        'api.artists': ('GET', '/api/v1/artists', None),
+        'api.artist': ('GET', '/api/v1/artists/{artist_id}'.format(**args), None),
+        'api.shows': ('GET', '/api/v1/shows', None),
+        'api.nearby_venues': ('GET', '/api/v1/venues/nearby?lat={lat}&lng={lng}'.format(**args), None),
+        'api.venues_in_box': ('GET', '/api/v1/venues/within?bbox={},{},{},{}'.format(
+            args['lat'] - 0.5, args['lng'] - 0.5, args['lat'] + 0.5, args['lng'] + 0.5), None),
+        'calendars.venue_calendar': ('GET', '/api/v1/venues/{venue_id}/calendar'.format(**args), None),
+        'calendars.artist_calendar': ('GET', '/api/v1/artists/{artist_id}/calendar'.format(**args), None),
+        'calendars.venue_feed': ('GET', '/venues/{venue_id}/shows.ics'.format(**args), None),
+        'calendars.artist_feed': ('GET', '/artists/{artist_id}/shows.ics'.format(**args), None),
+        'flasgger.apispec_1': ('GET', '/apispec_1.json', None),
+    }
+    if not writes:
+        return reads
+    return dict(reads, **{
+        'pages.create_venue_submission': ('POST', '/venues/create', venue_form('Benchmark Venue')),
+        'pages.edit_venue_submission': ('POST', '/venues/{venue_id}/edit'.format(**args),
+                                  venue_form('Benchmark Venue')),
+        'pages.create_artist_submission': ('POST', '/artists/create', artist_form('Benchmark Artist')),
+        'pages.edit_artist_submission': ('POST', '/artists/{artist_id}/edit'.format(**args),
+                                   artist_form('Benchmark Artist')),
+        'pages.create_show_submission': ('POST', '/shows/create', show_form(args)),
+    })
+
+
+def uncovered_endpoints(args):
+    # Routes added to the app without a scenario here.
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()}
+    return sorted(endpoints - set(scenarios(args, writes=True)) - set(SKIPPED_ENDPOINTS))
+
+
+def percentile(ordered, fraction):
+    # Nearest rank on an ascending list.
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+#----------------------------------------------------------------------------#
+# Clients.
+#----------------------------------------------------------------------------#
+
+class TestClient(object):
+    # In process: SQL statements and memory are measured too.
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, url, form):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = app.test_client()
+        form = form() if callable(form) else form
+        _statements.count = 0
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=form)
+        response.get_data()
+        return time.perf_counter() - started, response.status_code, _statements.count
+
+
+class HTTPClient(object):
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, url, form):
+        form = form() if callable(form) else form
+        data = urlencode(form, doseq=True).encode('ascii') if form is not None else None
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(self.base_url + url, data=data, method=method)) as response:
+                response.read()
+                status = response.status
+        except HTTPError as e:
+            e.read()
+            status = e.code
+        return time.perf_counter() - started, status, None
+
+
+#----------------------------------------------------------------------------#
+# Measurements.
+#----------------------------------------------------------------------------#
+
+def run_route(client, method, url, form, requests, concurrency, warmup):
+    for _ in range(warmup):
+        client.request(method, url, form)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(lambda _: client.request(method, url, form), range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _, _ in samples)
+    statements = [count for _, _, count in samples if count is not None]
+    return {
+        'method': method,
+        'url': url,
+        'requests': requests,
+        'errors': sum(1 for _, status, _ in samples if status >= 400),
+        'status': sorted({status for _, status, _ in samples}),
+        'throughput_rps': round(requests / elapsed, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'sql_per_request': {
+            'mean': round(sum(statements) / len(statements), 2),
+            'max': max(statements),
+        } if statements else None,
+    }
+
+
+def peak_memory(client, method, url, form):
+    # Peak Python allocations while serving one request, in KiB. Measured
+    # apart from the timed requests, which tracemalloc would slow down.
+    tracemalloc.start()
+    try:
+        client.request(method, url, form)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def catalog_size():
+    return {
+        'venues': Venue.query.count(),
+        'artists': Artist.query.count(),
+        'shows': Show.query.count(),
+    }
+
+
+def benchmark(options):
+    with app.app_context():
+        args = sample_arguments()
+        catalog = catalog_size()
+        db.session.remove()
+    plan = scenarios(args, writes=options.writes)
+    missing = uncovered_endpoints(args)
+    if missing:
+        print('No benchmark scenario for: {}'.format(', '.join(missing)), file=sys.stderr)
+    if options.only:
+        plan = {endpoint: scenario for endpoint, scenario in plan.items()
+                if any(only in endpoint for only in options.only)}
+
+    client = HTTPClient(options.url) if options.url else TestClient()
+    routes = {}
+    for endpoint, (method, url, form) in sorted(plan.items()):
+        result = run_route(client, method, url, form, options.requests, options.concurrency,
+                           options.warmup)
+        if not options.url:
+            result['peak_memory_kib'] = peak_memory(client, method, url, form)
+        routes[endpoint] = result
+        print('{:<28} {:>8.1f} req/s  p50 {:>8.2f} ms  p95 {:>8.2f} ms  p99 {:>8.2f} ms  {}'.format(
+            endpoint, result['throughput_rps'], result['latency_ms']['p50'],
+            result['latency_ms']['p95'], result['latency_ms']['p99'],
+            '{} SQL'.format(result['sql_per_request']['mean']) if result['sql_per_request'] else ''),
+            file=sys.stderr)
+    return {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'target': options.url or 'test client',
+            'requests': options.requests,
+            'concurrency': options.concurrency,
+            'cache': options.cache,
+            'catalog': catalog,
+        },
+        'routes': routes,
+    }
+
+
+def compare(results, baseline):
+    print('{:<28} {:>22} {:>22} {:>14}'.format('route', 'p50 ms', 'p95 ms', 'SQL/request'))
+    for endpoint, result in sorted(results['routes'].items()):
+        before = baseline['routes'].get(endpoint)
+        if before is None:
+            continue
+        cells = []
+        for key in ('p50', 'p95'):
+            old, new = before['latency_ms'][key], result['latency_ms'][key]
+            cells.append('{:.2f} -> {:.2f} ({:+.0%})'.format(old, new, (new - old) / old if old else 0))
+        old_sql, new_sql = before.get('sql_per_request'), result.get('sql_per_request')
+        sql = '{} -> {}'.format(old_sql['mean'], new_sql['mean']) if old_sql and new_sql else '-'
+        print('{:<28} {:>22} {:>22} {:>14}'.format(endpoint, cells[0], cells[1], sql))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--writes', action='store_true', help='also run the create/edit routes')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('--only', action='append', help='only endpoints containing this (repeatable)')
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--output', type=argparse.FileType('w'), help='write the results as JSON')
+    parser.add_argument('--compare', type=argparse.FileType('r'), help='results of an earlier run')
+    options = parser.parse_args()
+
+    if not options.cache:
+        response_cache.backend = None
+    if not options.url:
+        # Production settings: no template reloading, errors answered with 500.
+        app.debug = False
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+    results = benchmark(options)
+    if options.output:
+        json.dump(results, options.output, indent=2)
+        options.output.write('\n')
+    if options.compare:
+        compare(results, json.load(options.compare))
+
+
+if __name__ == '__main__':
+    main()
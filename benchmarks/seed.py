@@ -0,0 +1,198 @@
+"""Fill the database with a synthetic catalog of venues, artists and shows.
+
+    python -m benchmarks.seed [--venues 2000] [--artists 2000] [--shows 50000]
+                              [--areas 100] [--past 0.5] [--days 365]
+                              [--random-seed 1] [--reset]
+
+Rows are generated deterministically from --random-seed and inserted a chunk
+at a time, the show counters are rebuilt and the tables ANALYZEd, so the
+query planner sees the catalog as it would in production. Shows are spread
+over --days days either side of now, --past of them in the past, without
+double bookings. --reset empties the Venue, Artist and Show tables first.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import counters
+from app import create_app
+from forms import VenueForm
+from models import db, Venue, Artist, Show
+
+STATES = [state for state, _ in VenueForm.state.kwargs['choices']]
+GENRES = [genre for genre, _ in VenueForm.genres.kwargs['choices']]
+
+WORDS = ('Blue', 'Red', 'Golden', 'Silver', 'Velvet', 'Electric', 'Midnight', 'Rolling',
+         'Wild', 'Lucky', 'Iron', 'Crystal', 'Neon', 'Old', 'New', 'Little', 'Grand',
+         'Hidden', 'Northern', 'Southern', 'Eastern', 'Western', 'Brass', 'Paper')
+VENUE_KINDS = ('Hall', 'Club', 'Lounge', 'Theatre', 'Room', 'Tavern', 'Bar', 'Arena',
+               'Garden', 'Ballroom', 'Cellar', 'Stage')
+ARTIST_KINDS = ('Band', 'Trio', 'Quartet', 'Orchestra', 'Collective', 'Brothers',
+                'Sisters', 'Ensemble', 'Project', 'Experience', 'Choir', 'Crew')
+
+
+def _name(rng, kinds, number):
+    # The number keeps names unique, as the importer resolves shows by name.
+    return 'The {} {} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), rng.choice(kinds), number)
+
+
+# Areas are centered somewhere in the contiguous United States, and their
+# venues scattered a few km around the center.
+AREA_BOUNDS = ((25.0, 49.0), (-124.5, -67.0))
+AREA_SPREAD = 0.05
+
+
+def _areas(rng, count):
+    (south, north), (west, east) = AREA_BOUNDS
+    return [('City {}'.format(i), rng.choice(STATES), rng.uniform(south, north), rng.uniform(west, east))
+            for i in range(count)]
+
+
+def venue_rows(rng, count, areas):
+    for i in range(count):
+        city, state, latitude, longitude = rng.choice(areas)
+        seeking_talent = rng.random() < 0.3
+        yield {
+            'name': _name(rng, VENUE_KINDS, i + 1),
+            'city': city,
+            'state': state,
+            'address': '{} {} Street'.format(rng.randint(1, 9999), rng.choice(WORDS)),
+            'latitude': latitude + rng.gauss(0, AREA_SPREAD),
+            'longitude': longitude + rng.gauss(0, AREA_SPREAD),
+            'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999),
+                                                  rng.randint(0, 9999)),
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'image_link': 'https://images.example.com/venues/{}.jpg'.format(i + 1),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(i + 1),
+            'website': 'https://venue{}.example.com'.format(i + 1),
+            'seeking_talent': seeking_talent,
+            'seeking_description': 'Looking for local acts.' if seeking_talent else None,
+        }
+
+
+def artist_rows(rng, count, areas):
+    for i in range(count):
+        city, state, _, _ = rng.choice(areas)
+        seeking_venue = rng.random() < 0.3
+        yield {
+            'name': _name(rng, ARTIST_KINDS, i + 1),
+            'city': city,
+            'state': state,
+            'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(0, 999),
+                                                  rng.randint(0, 9999)),
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'image_link': 'https://images.example.com/artists/{}.jpg'.format(i + 1),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(i + 1),
+            'website': 'https://artist{}.example.com'.format(i + 1),
+            'seeking_venue': seeking_venue,
+            'seeking_description': 'Touring next season.' if seeking_venue else None,
+        }
+
+
+# Shows start on slot boundaries and last less than a slot, so shows in
+# different slots never overlap.
+SHOW_SLOT = timedelta(hours=3)
+SHOW_DURATION = timedelta(hours=2)
+
+
+def show_rows(rng, count, venue_ids, artist_ids, past, days, now):
+    # Popularity is skewed: a few venues and artists get most of the shows, as
+    # in a real catalog, which is what exposes per-entity query costs. A show
+    # whose venue or artist is already booked for the slot is drawn again
+    # (and dropped after a few attempts): Show rejects double bookings.
+    slots = max(int(timedelta(days=days) / SHOW_SLOT), 1)
+    origin = now.replace(minute=0, second=0, microsecond=0)
+    booked = set()
+    for _ in range(count):
+        for _ in range(10):
+            venue_id = venue_ids[int(len(venue_ids) * rng.random() ** 2)]
+            artist_id = artist_ids[int(len(artist_ids) * rng.random() ** 2)]
+            slot = rng.randint(1, slots)
+            slot = -slot if rng.random() < past else slot
+            if ('venue', venue_id, slot) not in booked and ('artist', artist_id, slot) not in booked:
+                break
+        else:
+            continue
+        booked.update((('venue', venue_id, slot), ('artist', artist_id, slot)))
+        start_time = origin + slot * SHOW_SLOT
+        yield {
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': start_time + SHOW_DURATION,
+        }
+
+
+def insert(model, rows, chunk_size):
+    # Returns the ids of the inserted rows, in order.
+    ids = []
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            ids += _insert_chunk(model, chunk)
+            chunk = []
+    if chunk:
+        ids += _insert_chunk(model, chunk)
+    return ids
+
+
+def _insert_chunk(model, chunk):
+    # Draw the ids from the sequence up front: executemany() has no RETURNING.
+    ids = [id for id, in db.session.execute(text(
+        "SELECT nextval(pg_get_serial_sequence('\"{}\"', 'id')) FROM generate_series(1, :n)".format(
+            model.__tablename__)), {'n': len(chunk)})]
+    for id, row in zip(ids, chunk):
+        row['id'] = id
+    db.session.execute(model.__table__.insert(), chunk)
+    db.session.commit()
+    return ids
+
+
+def seed(venues, artists, shows, areas=100, past=0.5, days=365, random_seed=1,
+         reset=False, chunk_size=5000, now=None):
+    rng = random.Random(random_seed)
+    now = now or datetime.now()
+    if reset:
+        db.session.execute(text('TRUNCATE "Show", "Venue", "Artist" RESTART IDENTITY'))
+        db.session.commit()
+    area_list = _areas(rng, areas)
+    venue_ids = insert(Venue, venue_rows(rng, venues, area_list), chunk_size)
+    artist_ids = insert(Artist, artist_rows(rng, artists, area_list), chunk_size)
+    show_ids = []
+    if shows and venue_ids and artist_ids:
+        show_ids = insert(Show, show_rows(rng, shows, venue_ids, artist_ids, past, days, now), chunk_size)
+    counters.recount()
+    db.session.commit()
+    with db.get_engine().connect() as conn:
+        conn.execution_options(isolation_level='AUTOCOMMIT').execute(
+            text('ANALYZE "Venue", "Artist", "Show"'))
+    return len(venue_ids), len(artist_ids), len(show_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--shows', type=int, default=50000)
+    parser.add_argument('--areas', type=int, default=100, help='distinct (city, state) pairs')
+    parser.add_argument('--past', type=float, default=0.5, help='fraction of shows in the past')
+    parser.add_argument('--days', type=int, default=365, help='shows fall within this many days of now')
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--reset', action='store_true', help='delete existing venues, artists and shows')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with create_app().app_context():
+        counts = seed(args.venues, args.artists, args.shows, areas=args.areas, past=args.past,
+                      days=args.days, random_seed=args.random_seed, reset=args.reset,
+                      chunk_size=args.chunk_size)
+    print('Seeded {} venues, {} artists and {} shows in {:.1f}s'.format(
+        *counts, time.perf_counter() - started), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
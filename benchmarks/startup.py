@@ -0,0 +1,159 @@
+"""Import and startup cost of a worker process.
+
+    python -m benchmarks.startup [--runs 5] [--path /] [--imports 15]
+                                 [--output results.json] [--compare old.json]
+
+Every run starts a fresh interpreter, which times `import app`, create_app()
+and a first request to --path, then forks the way a preforking server does
+with a preloaded app (gunicorn --preload) and times the forked worker's first
+request. On Linux the forked worker's resident memory is split into the part
+still shared with the master and its private part. Medians over --runs runs
+are reported, followed by the --imports modules slowest to import
+(python -X importtime).
+
+--output writes the results as JSON; --compare prints the changes against an
+earlier --output file.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from benchmarks import git_revision
+
+METRICS = ('import_ms', 'create_app_ms', 'first_request_ms', 'forked_first_request_ms',
+           'worker_shared_kib', 'worker_private_kib')
+
+
+def memory_kib():
+    # (shared, private) resident memory of this process; Linux only.
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line[0].isdigit())
+    except OSError:
+        return None, None
+    kib = {key: int(value.split()[0]) for key, value in fields.items()}
+    return (kib['Shared_Clean'] + kib['Shared_Dirty'],
+            kib['Private_Clean'] + kib['Private_Dirty'])
+
+
+def first_request(app, path):
+    started = time.perf_counter()
+    response = app.test_client().get(path)
+    response.get_data()
+    response.close()
+    if response.status_code != 200:
+        raise SystemExit('GET {} answered {}'.format(path, response.status_code))
+    return (time.perf_counter() - started) * 1000
+
+
+def probe(path):
+    # Runs in a fresh interpreter; prints one JSON line.
+    started = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    result = {'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000}
+
+    read, write = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        worker = {'forked_first_request_ms': (time.perf_counter() - forked) * 1000 + first_request(app, path)}
+        worker['worker_shared_kib'], worker['worker_private_kib'] = memory_kib()
+        with os.fdopen(write, 'w') as f:
+            json.dump(worker, f)
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as f:
+        worker = f.read()
+    os.waitpid(pid, 0)
+    if not worker:
+        raise SystemExit('the forked worker failed')
+    result.update(json.loads(worker))
+    result['first_request_ms'] = first_request(app, path)
+    print(json.dumps(result))
+
+
+def run_probe(path):
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.startup', '--probe', '--path', path])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def slowest_imports(count):
+    # Top level modules by cumulative import time, in ms.
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True).stderr.decode()
+    imports = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('   ') and not name.startswith('    '):
+            # Imported by app.py itself (the modules it imports are one level deeper).
+            imports[name.strip()] = int(cumulative) / 1000
+    return sorted(imports.items(), key=lambda item: -item[1])[:count]
+
+
+def benchmark(options):
+    runs = [run_probe(options.path) for _ in range(options.runs)]
+    results = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs if run.get(metric) is not None]
+        results[metric] = round(statistics.median(values), 1) if values else None
+        if values:
+            print('{:<26} {:>10.1f}'.format(metric, results[metric]), file=sys.stderr)
+    imports = slowest_imports(options.imports)
+    for name, ms in imports:
+        print('  import {:<30} {:>8.1f} ms'.format(name, ms), file=sys.stderr)
+    return {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'runs': options.runs,
+            'path': options.path,
+        },
+        'startup': results,
+        'imports': dict(imports),
+    }
+
+
+def compare(results, baseline):
+    print('{:<26} {:>12} {:>12} {:>8}'.format('metric', 'before', 'after', 'change'))
+    for metric in METRICS:
+        old, new = baseline['startup'].get(metric), results['startup'].get(metric)
+        if old is None or new is None:
+            continue
+        print('{:<26} {:>12.1f} {:>12.1f} {:>+8.0%}'.format(metric, old, new, (new - old) / old if old else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to time')
+    parser.add_argument('--path', default='/', help='URL of the first request')
+    parser.add_argument('--imports', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--output', type=argparse.FileType('w'), help='write the results as JSON')
+    parser.add_argument('--compare', type=argparse.FileType('r'), help='results of an earlier run')
+    parser.add_argument('--probe', action='store_true', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.probe:
+        probe(options.path)
+        return
+    results = benchmark(options)
+    if options.output:
+        json.dump(results, options.output, indent=2)
+        options.output.write('\n')
+    if options.compare:
+        compare(results, json.load(options.compare))
+
+
+if __name__ == '__main__':
+    main()
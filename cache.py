@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, jsonify, make_response, request, session
+from auth import admin_required
+from models import db, Show
+
+
+#----------------------------------------------------------------------------#
+# Response cache.
+#
+# Read pages are cached per endpoint, view arguments and query string. Every
+# cached page belongs to one tag ('venues', 'venue:3', ...) and its key
+# embeds the tag's current generation; invalidating a tag bumps the
+# generation, which orphans every variant of the page at once (old entries
+# age out of the LRU or get pruned from disk). Generations live in the
+# backend so a shared backend also shares invalidations.
+#----------------------------------------------------------------------------#
+
+class LRUBackend(object):
+    # In-process store bounded by entry count and total body size.
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry[2])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[2])
+            self._entries[key] = entry
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[2])
+                self.evictions += 1
+
+    def generation(self, tag):
+        return self._generations.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class DiskBackend(object):
+    # One file per entry under `directory`, safe to share between the worker
+    # processes of a host. Oldest entries are pruned past `max_entries` or
+    # `max_bytes` in all, checked every PRUNE_EVERY writes.
+
+    PRUNE_EVERY = 64
+
+    def __init__(self, directory, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._writes = 0
+        os.makedirs(os.path.join(directory, 'generations'), exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                header, body = f.read().split(b'\n', 1)
+        except (OSError, ValueError):
+            return None
+        expires, content_type = json.loads(header)
+        return expires, content_type, body
+
+    def set(self, key, entry):
+        expires, content_type, body = entry
+        if len(body) > self.max_bytes:
+            return
+        self._write(self._path(key), json.dumps([expires, content_type]).encode('utf-8') + b'\n' + body)
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        entries = [e for e in os.scandir(self.directory) if e.is_file() and not e.name.startswith('tmp')]
+        count, size = len(entries), sum(e.stat().st_size for e in entries)
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries:
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            count, size = count - 1, size - entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def generation(self, tag):
+        try:
+            with open(os.path.join(self.directory, 'generations', tag.replace(':', '_')), 'rb') as f:
+                return int(f.read() or 0)
+        except OSError:
+            return 0
+
+    def bump(self, tag):
+        # A racing bump may be lost, but either way the generation changes.
+        path = os.path.join(self.directory, 'generations', tag.replace(':', '_'))
+        self._write(path, str(self.generation(tag) + 1).encode('ascii'))
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                os.remove(entry.path)
+
+
+class ResponseCache(object):
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 0
+        self.hits = self.misses = self.stores = self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('RESPONSE_CACHE_BACKEND')
+        if kind == 'lru':
+            self.backend = LRUBackend(app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+                                      app.config['RESPONSE_CACHE_MAX_BYTES'])
+        elif kind == 'disk':
+            self.backend = DiskBackend(app.config['RESPONSE_CACHE_DIR'],
+                                       app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+                                       app.config['RESPONSE_CACHE_MAX_BYTES'])
+        elif kind:
+            raise ValueError('Unknown RESPONSE_CACHE_BACKEND {!r}'.format(kind))
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 60)
+        app.add_url_rule('/admin/cache', 'cache_stats', admin_required(self.stats_view))
+
+    def cached(self, tag):
+        # Cache a GET view under `tag`, formatted with the view arguments,
+        # e.g. @response_cache.cached('venue:{venue_id}').
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pages carrying flashed messages are personal: skip them.
+                if self.backend is None or '_flashes' in session:
+                    return view(**kwargs)
+                key = self._key(tag.format(**kwargs), kwargs)
+                entry = self.backend.get(key)
+                if entry is not None and entry[0] > time.time():
+                    self.hits += 1
+                    response = Response(entry[2], content_type=entry[1])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                self.misses += 1
+                response = make_response(view(**kwargs))
+                if response.status_code == 200 and '_flashes' not in session:
+                    self._store(key, response)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def _key(self, tag, kwargs):
+        return '{}|{}|{}|{}|{}'.format(
+            request.endpoint, tag, self.backend.generation(tag),
+            sorted(kwargs.items()), request.query_string.decode('latin-1'))
+
+    def _store(self, key, response):
+        expires = time.time() + self.ttl
+        content_type = response.headers['Content-Type']
+        if not response.is_streamed:
+            self.stores += 1
+            self.backend.set(key, (expires, content_type, response.get_data()))
+            return
+
+        # Tee streamed pages and store them once fully sent.
+        def tee(chunks):
+            body = []
+            for chunk in chunks:
+                body.append(chunk)
+                yield chunk
+            self.stores += 1
+            self.backend.set(key, (expires, content_type, b''.join(body)))
+        response.response = tee(response.iter_encoded())
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in set(tags):
+            self.backend.bump(tag)
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.backend.evictions if self.backend else 0,
+            'invalidations': self.invalidations,
+        }
+
+    def stats_view(self):
+        # Per-process counters.
+        return jsonify(self.stats())
+
+
+response_cache = ResponseCache()
+
+
+#----------------------------------------------------------------------------#
+# Tags touched by writes.
+#----------------------------------------------------------------------------#
+
+def venue_tags(*venue_ids):
+    # The venue pages, the listings and every artist page that shows these
+    # venues' names. Call before the venues' shows are gone.
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id.in_(venue_ids)).distinct()
+    return ['venues', 'shows'] + ['venue:{}'.format(venue_id) for venue_id in venue_ids] + \
+        ['artist:{}'.format(artist_id) for artist_id, in artist_ids]
+
+
+def artist_tags(*artist_ids):
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id.in_(artist_ids)).distinct()
+    return ['artists', 'shows'] + ['artist:{}'.format(artist_id) for artist_id in artist_ids] + \
+        ['venue:{}'.format(venue_id) for venue_id, in venue_ids]
+
+
+def show_tags(venue_id, artist_id):
+    # The listings too: the API's carry the show counters.
+    return ['shows', 'venues', 'artists', 'venue:{}'.format(venue_id), 'artist:{}'.format(artist_id)]
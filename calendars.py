@@ -0,0 +1,270 @@
+import hashlib
+from datetime import date, datetime, time, timedelta, timezone
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context, url_for
+from api import json_response
+from models import db, Venue, Artist
+from queries import calendar_days, calendar_version, calendar_feed
+
+
+#----------------------------------------------------------------------------#
+# Calendars.
+#
+# A month or week of a venue's or an artist's bookings, counted by day in
+# SQL, and their shows as iCalendar feeds streamed from a server-side
+# cursor. Both carry an ETag derived from calendar_version(), which costs
+# an index scan: a client polling with If-None-Match gets a 304 without the
+# calendar being built.
+#----------------------------------------------------------------------------#
+
+calendars = Blueprint('calendars', __name__)
+
+VIEWS = ('month', 'week')
+
+# model, Show column, page endpoint
+ENTITIES = {
+    'venue': (Venue, 'venue_id', 'pages.show_venue'),
+    'artist': (Artist, 'artist_id', 'pages.show_artist'),
+}
+
+
+def calendar_range(view, day):
+    # [start, end) of the month, or Monday to Monday week, holding day.
+    if view == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    start = day.replace(day=1)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def load_entity(kind, entity_id):
+    model = ENTITIES[kind][0]
+    entity = db.session.query(model.id, model.name, model.updated_at) \
+        .filter(model.id == entity_id, model.listed()) \
+        .first()
+    if entity is None:
+        abort(404, '{} {} not found'.format(model.__name__, entity_id))
+    return entity
+
+
+def etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+
+
+def not_modified(tag):
+    # The 304 for a client that has this version, or None.
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+        _validators(response, tag)
+        return response
+    return None
+
+
+def _validators(response, tag):
+    response.set_etag(tag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['CALENDAR_MAX_AGE']
+    return response
+
+
+#----------------------------------------------------------------------------#
+# Day by day.
+#----------------------------------------------------------------------------#
+
+def _calendar(kind, entity_id):
+    view = request.args.get('view', 'month')
+    if view not in VIEWS:
+        abort(400, 'view must be one of {}'.format(', '.join(VIEWS)))
+    try:
+        day = date.fromisoformat(request.args['date']) if 'date' in request.args else date.today()
+    except ValueError:
+        abort(400, 'date must be YYYY-MM-DD')
+    start, end = calendar_range(view, day)
+    start, end = datetime.combine(start, time()), datetime.combine(end, time())
+
+    entity = load_entity(kind, entity_id)
+    column = ENTITIES[kind][1]
+    tag = etag(kind, entity_id, view, start, entity.updated_at, *calendar_version(column, entity_id, start, end))
+    response = not_modified(tag)
+    if response is not None:
+        return response
+
+    days = [{
+        'date': row.day,
+        'shows': row.shows,
+        'booked_minutes': int(row.booked.total_seconds() // 60),
+        'free': row.shows == 0
+    } for row in calendar_days(column, entity_id, start, end)]
+    return _validators(json_response({
+        kind + '_id': entity.id,
+        'name': entity.name,
+        'view': view,
+        'start': start.date(),
+        'end': end.date(),
+        'days': days
+    }), tag)
+
+
+@calendars.route('/api/v1/venues/<int:venue_id>/calendar')
+def venue_calendar(venue_id):
+    """
+    A month or week of a venue's bookings, by day
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: venue_id
+        in: path
+        type: integer
+        required: true
+      - name: view
+        in: query
+        type: string
+        enum: [month, week]
+        default: month
+      - name: date
+        in: query
+        type: string
+        description: A day of the month or week, YYYY-MM-DD (default today)
+    responses:
+      200:
+        description: Shows and booked minutes of every day, with an ETag
+      304:
+        description: Unchanged since the If-None-Match ETag
+      400:
+        description: Invalid view or date
+      404:
+        description: No such venue
+    """
+    return _calendar('venue', venue_id)
+
+
+@calendars.route('/api/v1/artists/<int:artist_id>/calendar')
+def artist_calendar(artist_id):
+    """
+    A month or week of an artist's bookings, by day
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: artist_id
+        in: path
+        type: integer
+        required: true
+      - name: view
+        in: query
+        type: string
+        enum: [month, week]
+        default: month
+      - name: date
+        in: query
+        type: string
+        description: A day of the month or week, YYYY-MM-DD (default today)
+    responses:
+      200:
+        description: Shows and booked minutes of every day, with an ETag
+      304:
+        description: Unchanged since the If-None-Match ETag
+      400:
+        description: Invalid view or date
+      404:
+        description: No such artist
+    """
+    return _calendar('artist', artist_id)
+
+
+#----------------------------------------------------------------------------#
+# iCalendar feeds (RFC 5545).
+#----------------------------------------------------------------------------#
+
+def ics_text(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def ics_line(line):
+    # Folded at 75 octets, without splitting a UTF-8 sequence.
+    if len(line.encode('utf-8')) <= 75:
+        return line + '\r\n'
+    folded, size = [], 0
+    for char in line:
+        octets = len(char.encode('utf-8'))
+        if size + octets > 75:
+            folded.append('\r\n ')
+            size = 1
+        folded.append(char)
+        size += octets
+    return ''.join(folded) + '\r\n'
+
+
+def ics_local(value):
+    # Floating time: shows are stored in the venue's local time.
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def ics_utc(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def ics_event(show, page_url):
+    lines = [
+        'BEGIN:VEVENT',
+        'UID:show-{}@{}'.format(show.id, request.host),
+        'DTSTAMP:' + ics_utc(show.updated_at),
+        'LAST-MODIFIED:' + ics_utc(show.updated_at),
+        'DTSTART:' + ics_local(show.start_time),
+        'DTEND:' + ics_local(show.end_time),
+        'SUMMARY:{} at {}'.format(ics_text(show.artist_name), ics_text(show.venue_name)),
+        'LOCATION:' + ics_text(', '.join(part for part in (show.address, show.city, show.state) if part)),
+    ]
+    if show.latitude is not None and show.longitude is not None:
+        lines.append('GEO:{:.6f};{:.6f}'.format(show.latitude, show.longitude))
+    lines += ['URL:' + page_url, 'END:VEVENT']
+    return ''.join(ics_line(line) for line in lines)
+
+
+def _feed(kind, entity_id):
+    # Shows from ICAL_PAST_DAYS ago on.
+    entity = load_entity(kind, entity_id)
+    column = ENTITIES[kind][1]
+    since = datetime.combine(date.today() - timedelta(days=current_app.config['ICAL_PAST_DAYS']), time())
+    tag = etag(kind, entity_id, 'ics', since, entity.updated_at, *calendar_version(column, entity_id, since))
+    response = not_modified(tag)
+    if response is not None:
+        return response
+
+    # The counterpart's page: the artist for a venue's shows and vice versa.
+    counterpart = 'artist' if kind == 'venue' else 'venue'
+    endpoint = ENTITIES[counterpart][2]
+
+    def generate():
+        yield ''.join(ics_line(line) for line in (
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//Fyyur//Shows//EN',
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            'X-WR-CALNAME:' + ics_text(entity.name),
+        ))
+        for show in calendar_feed(column, entity_id, since, current_app.config['ICAL_BATCH_SIZE']):
+            yield ics_event(show, url_for(endpoint, _external=True,
+                                          **{counterpart + '_id': getattr(show, counterpart + '_id')}))
+        yield ics_line('END:VCALENDAR')
+
+    response = Response(stream_with_context(generate()), mimetype='text/calendar')
+    response.headers['Content-Disposition'] = 'inline; filename="{}-{}.ics"'.format(kind, entity_id)
+    return _validators(response, tag)
+
+
+@calendars.route('/venues/<int:venue_id>/shows.ics')
+def venue_feed(venue_id):
+    return _feed('venue', venue_id)
+
+
+@calendars.route('/artists/<int:artist_id>/shows.ics')
+def artist_feed(artist_id):
+    return _feed('artist', artist_id)
+
+
+@calendars.errorhandler(400)
+@calendars.errorhandler(404)
+def calendar_error(error):
+    return json_response({'error': error.description}, status=error.code)
@@ -1,8 +1,37 @@
 import os
+import secrets
+import tempfile
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def instance_secret_key(instance_path):
+    # Generated by the first process that needs it, then read by every
+    # other: workers must sign sessions and CSRF tokens with the same key.
+    path = os.path.join(instance_path, 'secret_key')
+    if not os.path.exists(path):
+        os.makedirs(instance_path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=instance_path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    with open(path) as f:
+        return f.read().strip()
+
+
 class Config(object):
 
     DEBUG = True
@@ -13,8 +42,144 @@ class Config(object):
     username = 'postgres'
     password = 'postgres'
     url = 'localhost:5432'
-    SQLALCHEMY_DATABASE_URI = "postgres://{}:{}@{}/{}".format(username, password, url, DATABASE_NAME)
+    # DATABASE_URL overrides it, e.g. in production
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', "postgres://{}:{}@{}/{}".format(username, password, url, DATABASE_NAME))
+
+    # Read replicas for GET requests, comma separated; empty reads from the
+    # primary. Clients that just wrote keep reading from the primary for
+    # READ_YOUR_WRITES_SECONDS (see routing.py).
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    READ_YOUR_WRITES_SECONDS = env_int('DB_READ_YOUR_WRITES_SECONDS', 5)
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    SECRET_KEY = os.urandom(32)
\ No newline at end of file
+    # Connection pool, per worker process and per engine (primary and each
+    # replica). executemany_mode batches executemany() into multi-row
+    # INSERT ... VALUES statements.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'executemany_mode': 'values',
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True),
+        'connect_args': {
+            'options': '-c statement_timeout={}'.format(env_int('DB_STATEMENT_TIMEOUT_MS', 15000))
+        },
+    }
+
+    # Venues listed per (city, state) area on /venues before paging kicks in
+    VENUES_PER_AREA = 20
+
+    # Page size of the venue and artist search results
+    SEARCH_RESULTS_LIMIT = 25
+
+    # Show tiles per /shows page, and how many template events are buffered
+    # before a chunk of a streamed page is flushed to the client
+    SHOWS_PER_PAGE = 30
+    TEMPLATE_STREAM_BUFFER = 5
+
+    # Shared secret of the /admin endpoints (X-Admin-Token header); unset
+    # disables them
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+    # Server-side cache of the read pages: 'disk' (shared by the workers of
+    # a host), 'lru' (per process) or empty to disable. Writes invalidate the
+    # pages they affect, but only in the backend of the process handling
+    # them: 'lru' is only correct with a single worker, and several hosts
+    # should disable the cache. The TTL bounds time-driven staleness such as
+    # shows moving from upcoming to past.
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'disk') or None
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RESPONSE_CACHE_DIR = os.path.join(basedir, 'cache', 'responses')
+    RESPONSE_CACHE_TTL = 60
+
+    # Compiled templates are cached on disk, shared by the workers of a host,
+    # and all compiled at startup. Fragments cached with {% cache %} live in
+    # the response cache backend for FRAGMENT_CACHE_TTL seconds at most.
+    TEMPLATE_BYTECODE_DIR = os.path.join(basedir, 'cache', 'templates')
+    TEMPLATE_PRECOMPILE = True
+    FRAGMENT_CACHE_TTL = 3600
+
+    # Default and maximum page size of the /api/v1 listings
+    API_PAGE_SIZE = 50
+    API_PAGE_SIZE_MAX = 500
+
+    # Local file venues are geocoded from (geocoding.py), and the largest
+    # radius, in km, of the /api/v1/venues/nearby lookups
+    GAZETTEER_FILE = os.environ.get('GAZETTEER_FILE', os.path.join(basedir, 'data', 'gazetteer.csv'))
+    NEARBY_MAX_RADIUS_KM = 500
+
+    # Calendars (calendars.py): how long clients may reuse a calendar before
+    # revalidating it with its ETag, how far back the .ics feeds go and how
+    # many shows they fetch per round trip
+    CALENDAR_MAX_AGE = 60
+    ICAL_PAST_DAYS = 90
+    ICAL_BATCH_SIZE = 500
+
+    # Rows per INSERT/transaction of the bulk importer, and how many rejected
+    # rows an upload reports back
+    IMPORT_CHUNK_SIZE = 1000
+    IMPORT_MAX_REPORTED_ERRORS = 1000
+
+    # Rows per round trip of the bulk exports (exporter.py), and how recent
+    # a change may be, in seconds, and still wait for the next incremental
+    # export
+    EXPORT_BATCH_SIZE = 1000
+    EXPORT_WATERMARK_LAG = 60
+
+    # Deleted venues are only marked deleted until `flask purge-deleted`
+    # removes them, PURGE_BATCH_SIZE rows per transaction (purge.py)
+    SOFT_DELETE = True
+    PURGE_BATCH_SIZE = 1000
+
+    # Most updates in one PATCH of /api/v1/venues or /api/v1/artists
+    # (updates.py), all applied in one transaction
+    BATCH_UPDATE_MAX_ITEMS = 1000
+
+    # Application log (logs.py): JSON lines written by a background thread.
+    # Every request is logged with its latency when LOG_REQUESTS is set;
+    # repeats of an exception within LOG_DUPLICATE_WINDOW seconds are only
+    # counted. The workers of a server all append to LOG_FILE and
+    # SLOW_REQUEST_LOG, so with LOG_MAX_BYTES = 0 they leave the rotation to
+    # logrotate and reopen a file once it is moved. Rotating at LOG_MAX_BYTES,
+    # keeping LOG_BACKUP_COUNT files, is only safe in a single process: each
+    # worker would rotate the shared file on its own.
+    LOG_FILE = os.environ.get('LOG_FILE', os.path.join(basedir, 'fyyur.log'))
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_MAX_BYTES = env_int('LOG_MAX_BYTES', 0)
+    LOG_BACKUP_COUNT = 5
+    LOG_QUEUE_SIZE = 10000
+    LOG_DUPLICATE_WINDOW = 60
+    LOG_REQUESTS = env_bool('LOG_REQUESTS', True)
+
+    # Per request SQL instrumentation (instrumentation.py). Requests slower
+    # than SLOW_REQUEST_MS, requests with a statement slower than
+    # SLOW_QUERY_MS and requests repeating a statement with
+    # N_PLUS_ONE_THRESHOLD different parameter sets are logged to
+    # SLOW_REQUEST_LOG with their SLOWEST_STATEMENTS slowest statements.
+    SQL_INSTRUMENTATION = True
+    SERVER_TIMING_HEADER = True
+    SLOW_REQUEST_MS = env_int('SLOW_REQUEST_MS', 500)
+    SLOW_QUERY_MS = env_int('SLOW_QUERY_MS', 100)
+    SLOWEST_STATEMENTS = 3
+    N_PLUS_ONE_THRESHOLD = 5
+    SLOW_REQUEST_LOG = os.path.join(basedir, 'slow_requests.log')
+
+    # Request profiler (profiler.py): requests sending the ADMIN_TOKEN in an
+    # X-Profile header are profiled, and PROFILER_SAMPLE_RATE of all others.
+    # The newest PROFILER_MAX_PROFILES profiles of every endpoint are kept.
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))
+    PROFILER_INTERVAL = 0.005
+    PROFILER_DIR = os.path.join(basedir, 'profiles')
+    PROFILER_MAX_PROFILES = 200
+
+    # /apidocs and /apispec_1.json (flasgger)
+    SWAGGER_ENABLED = env_bool('SWAGGER_ENABLED', True)
+
+    # Signs sessions and CSRF tokens. Unset, one is generated and kept in
+    # instance/secret_key, shared by the workers of the host; set it when the
+    # app runs on more than one host.
+    SECRET_KEY = os.environ.get('SECRET_KEY')
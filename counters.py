@@ -0,0 +1,142 @@
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from models import db
+
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue/Artist.upcoming_shows_count and past_shows_count classify every show
+# against CounterRollover.rolled_at, not against the wall clock, so they stay
+# exact between rollovers. Writers take a share lock on the watermark row and
+# rollover() takes an exclusive one, which keeps a show created mid-rollover
+# from being counted on the wrong side.
+#----------------------------------------------------------------------------#
+
+ENTITIES = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def _watermark(lock='SHARE'):
+    return db.session.execute(
+        text('SELECT rolled_at FROM "CounterRollover" WHERE id = 1 FOR ' + lock)).scalar()
+
+
+def record_show(show_id, delta=1):
+    # Call after the show is flushed, inside the transaction that creates (or,
+    # with delta=-1, deletes) it.
+    rolled_at = _watermark()
+    for table, column in ENTITIES:
+        db.session.execute(text('''
+            UPDATE "{table}" e
+               SET upcoming_shows_count = e.upcoming_shows_count + :delta * (s.start_time >= :rolled_at)::int,
+                   past_shows_count = e.past_shows_count + :delta * (s.start_time < :rolled_at)::int
+              FROM "Show" s
+             WHERE s.id = :show_id AND e.id = s.{column}
+        '''.format(table=table, column=column)),
+            {'show_id': show_id, 'delta': delta, 'rolled_at': rolled_at})
+
+
+def forget_shows(owner_column, owner_id):
+    # Take the shows of a venue (owner_column='venue_id') or an artist
+    # ('artist_id') off the counters of their counterparts before the owner and
+    # its shows are deleted. Returns the rollover watermark they were counted
+    # against.
+    rolled_at = _watermark()
+    for table, column in ENTITIES:
+        if column == owner_column:
+            continue
+        db.session.execute(text('''
+            UPDATE "{table}" e
+               SET upcoming_shows_count = e.upcoming_shows_count - s.upcoming,
+                   past_shows_count = e.past_shows_count - s.past
+              FROM (SELECT {column} AS id,
+                           count(*) FILTER (WHERE start_time >= :rolled_at) AS upcoming,
+                           count(*) FILTER (WHERE start_time < :rolled_at) AS past
+                      FROM "Show"
+                     WHERE {owner_column} = :owner_id
+                     GROUP BY {column}) s
+             WHERE e.id = s.id
+        '''.format(table=table, column=column, owner_column=owner_column)),
+            {'owner_id': owner_id, 'rolled_at': rolled_at})
+    return rolled_at
+
+
+def recount(table=None, ids=None):
+    # Rebuild counters from the Show table, for every row or just `ids`. The
+    # shows left of deleted venues are not counted (see purge.py).
+    rolled_at = _watermark()
+    for name, column in ENTITIES:
+        if table is not None and name != table:
+            continue
+        db.session.execute(text('''
+            UPDATE "{table}" e
+               SET upcoming_shows_count = coalesce(s.upcoming, 0),
+                   past_shows_count = coalesce(s.past, 0)
+              FROM "{table}" t
+              LEFT JOIN (SELECT {column} AS id,
+                                count(*) FILTER (WHERE start_time >= :rolled_at) AS upcoming,
+                                count(*) FILTER (WHERE start_time < :rolled_at) AS past
+                           FROM "Show"
+                          WHERE venue_id NOT IN (SELECT id FROM "Venue" WHERE deleted_at IS NOT NULL)
+                          {shows_only}
+                          GROUP BY {column}) s ON s.id = t.id
+             WHERE e.id = t.id {only}
+        '''.format(table=name, column=column,
+                   shows_only='AND {} = ANY(:ids)'.format(column) if ids is not None else '',
+                   only='AND t.id = ANY(:ids)' if ids is not None else '')),
+            {'rolled_at': rolled_at, 'ids': list(ids or ())})
+
+
+def rollover(until=None):
+    # Move the shows whose start_time crossed into the past since the last run
+    # from the upcoming to the past counters. Returns the number of shows moved.
+    until = until or datetime.now()
+    since = _watermark(lock='UPDATE')
+    if until <= since:
+        return 0
+    moved = db.session.execute(text('''
+        SELECT count(*) FROM "Show" WHERE start_time >= :since AND start_time < :until
+    '''), {'since': since, 'until': until}).scalar()
+    for table, column in ENTITIES:
+        db.session.execute(text('''
+            UPDATE "{table}" e
+               SET upcoming_shows_count = e.upcoming_shows_count - s.crossed,
+                   past_shows_count = e.past_shows_count + s.crossed
+              FROM (SELECT {column} AS id, count(*) AS crossed
+                      FROM "Show"
+                     WHERE start_time >= :since AND start_time < :until
+                     GROUP BY {column}) s
+             WHERE e.id = s.id
+        '''.format(table=table, column=column)), {'since': since, 'until': until})
+    db.session.execute(text('UPDATE "CounterRollover" SET rolled_at = :until WHERE id = 1'),
+                       {'until': until})
+    return moved
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+cli = AppGroup('counters', help='Maintain the per venue/artist show counters.')
+
+
+@cli.command('rollover')
+def rollover_command():
+    """Roll shows that started since the last run into the past counters.
+
+    Schedule this (e.g. every few minutes from cron); it only touches shows
+    that crossed the boundary since the previous run.
+    """
+    moved = rollover()
+    db.session.commit()
+    click.echo('Rolled {} show(s) into the past.'.format(moved))
+
+
+@cli.command('recount')
+def recount_command():
+    """Rebuild every counter from the Show table."""
+    recount()
+    db.session.commit()
+    click.echo('Show counters rebuilt.')
@@ -0,0 +1,280 @@
+import csv
+import io
+import os
+import zlib
+from datetime import datetime, timedelta
+from itertools import islice
+import click
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import ARRAY, Boolean, DateTime, Float, Integer, and_, func, or_
+from api import dumps
+from auth import admin_required
+from importer import CSV_LIST_SEPARATOR
+from models import db, Venue, Artist, Show
+
+try:
+    # Optional: Parquet files are only written with it.
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+#
+# The whole of a table (every column, in id order) is read from a
+# server-side cursor EXPORT_BATCH_SIZE rows at a time and written out one
+# batch at a time, as CSV or NDJSON, optionally gzipped, or as Parquet, one
+# row group per batch: memory stays flat whatever the size of the table.
+# CSV files separate genres as the importer does.
+#
+# Incremental runs take rows past either watermark of the previous one: a
+# larger id (new rows) or a later updated_at (new or changed rows). The
+# watermarks of the next run are fixed before the first row is read, so
+# rows written meanwhile are left to it rather than lost. Deleted rows are
+# not: a soft-deleted venue comes out with its deleted_at, but the shows
+# cancelled with it, the venues deleted without SOFT_DELETE and whatever
+# purge-deleted removes are simply gone. A copy kept up to date from
+# incremental runs has to be reloaded from a full export after those.
+#----------------------------------------------------------------------------#
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+
+KINDS = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return CSV_LIST_SEPARATOR.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def arrow_type(column):
+    if isinstance(column.type, ARRAY):
+        return pyarrow.list_(pyarrow.string())
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, Float):
+        return pyarrow.float64()
+    if isinstance(column.type, DateTime):
+        return pyarrow.timestamp('us')
+    return pyarrow.string()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Spool(object):
+    # The file a ParquetWriter writes to, emptied after every row group: the
+    # writer only appends, and only needs to know how much it has written.
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class Exporter(object):
+
+    def __init__(self, kind, format, after_id=None, updated_since=None, compress=False,
+                 batch_size=1000, lag=0):
+        if kind not in KINDS:
+            raise ValueError('Unknown kind {!r}'.format(kind))
+        if format not in FORMATS:
+            raise ValueError('Unknown format {!r}'.format(format))
+        if format == 'parquet' and pyarrow is None:
+            raise ValueError('Parquet exports need pyarrow')
+        self.kind = kind
+        self.format = format
+        self.model = KINDS[kind]
+        self.columns = list(self.model.__table__.columns)
+        self.after_id = after_id
+        self.updated_since = updated_since
+        self.compress = compress
+        self.batch_size = batch_size
+        self.exported = 0
+        # Rows changed in the last `lag` seconds are left to the next run: a
+        # transaction still open now may commit an earlier updated_at.
+        self.last_id = max(db.session.query(func.max(self.model.id)).scalar() or 0, after_id or 0)
+        self.until = (datetime.now() - timedelta(seconds=lag)).replace(microsecond=0)
+
+    @property
+    def filename(self):
+        suffix = '.gz' if self.compress and self.format != 'parquet' else ''
+        return '{}.{}{}'.format(self.kind, self.format, suffix)
+
+    def watermarks(self):
+        # Where the next run starts.
+        return {'after_id': self.last_id, 'updated_since': self.until}
+
+    def query(self):
+        model = self.model
+        query = db.session.query(*self.columns).filter(model.id <= self.last_id)
+        # A row past either watermark: new, or changed since the last run
+        past = []
+        if self.after_id is not None:
+            past.append(model.id > self.after_id)
+        if self.updated_since is not None:
+            past.append(and_(model.updated_at > self.updated_since, model.updated_at <= self.until))
+        if past:
+            query = query.filter(or_(*past))
+        return query.order_by(model.id).yield_per(self.batch_size)
+
+    def batches(self):
+        rows = iter(self.query())
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            self.exported += len(batch)
+            yield batch
+
+    def chunks(self):
+        # The file, as an iterable of bytes.
+        if self.format == 'parquet':
+            return self._parquet()
+        chunks = self._csv() if self.format == 'csv' else self._ndjson()
+        return gzipped(chunks) if self.compress else chunks
+
+    def _csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([column.name for column in self.columns])
+        for batch in self.batches():
+            writer.writerows([csv_value(value) for value in row] for row in batch)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    def _ndjson(self):
+        names = [column.name for column in self.columns]
+        for batch in self.batches():
+            yield b''.join(dumps(dict(zip(names, row))) + b'\n' for row in batch)
+
+    def _parquet(self):
+        schema = pyarrow.schema([(column.name, arrow_type(column)) for column in self.columns])
+        spool = _Spool()
+        writer = pyarrow.parquet.ParquetWriter(spool, schema, compression='gzip' if self.compress else 'snappy')
+        for batch in self.batches():
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)],
+                schema=schema))
+            yield spool.drain()
+        writer.close()
+        yield spool.drain()
+
+
+#----------------------------------------------------------------------------#
+# Download endpoint and command.
+#----------------------------------------------------------------------------#
+
+exports = Blueprint('exports', __name__)
+
+
+@exports.route('/export/<kind>')
+@admin_required
+def export_download(kind):
+    # ?format=csv|ndjson|parquet (csv by default), ?gzip=1, and ?after_id=
+    # and/or ?updated_since= for an incremental run. The watermarks of the
+    # next run come in the X-Export-After-Id and X-Export-Updated-Since
+    # headers. Incremental runs miss hard deletes (see above).
+    try:
+        updated_since = request.args.get('updated_since')
+        exporter = Exporter(kind, request.args.get('format', 'csv'),
+                            after_id=request.args.get('after_id', type=int),
+                            updated_since=datetime.fromisoformat(updated_since) if updated_since else None,
+                            compress=request.args.get('gzip') == '1',
+                            batch_size=current_app.config['EXPORT_BATCH_SIZE'],
+                            lag=current_app.config['EXPORT_WATERMARK_LAG'])
+    except ValueError as e:
+        abort(400, str(e))
+    response = Response(stream_with_context(exporter.chunks()), mimetype=MIMETYPES[exporter.format])
+    response.headers['Content-Disposition'] = 'attachment; filename="{}"'.format(exporter.filename)
+    watermarks = exporter.watermarks()
+    response.headers['X-Export-After-Id'] = str(watermarks['after_id'])
+    response.headers['X-Export-Updated-Since'] = watermarks['updated_since'].isoformat()
+    return response
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('dest', type=click.File('wb'), default='-')
+@click.option('--format', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the file (implied by a .gz DEST).')
+@click.option('--after-id', type=int, default=None, help='Only rows with a larger id.')
+@click.option('--updated-since', type=click.DateTime(), default=None,
+              help='Only rows created or changed after this time.')
+@click.option('--batch-size', type=int, default=None, help='Rows per round trip to the database.')
+@with_appcontext
+def export_command(kind, dest, format, compress, after_id, updated_since, batch_size):
+    """Stream venues, artists or shows to a CSV, NDJSON or Parquet file.
+
+    DEST defaults to standard output. Parquet needs pyarrow; with --gzip its
+    column chunks are gzip compressed instead of snappy. Pass the options
+    printed at the end to the next run to export only what changed.
+
+    Incremental runs do not carry deletes, bar the deleted_at of
+    soft-deleted venues. The shows cancelled with a venue, and the rows
+    removed by purge-deleted or by a delete without SOFT_DELETE, only leave
+    a copy with a full export.
+    """
+    name = dest.name
+    if name.endswith('.gz'):
+        compress, name = True, name[:-len('.gz')]
+    format = format or os.path.splitext(name)[1].lstrip('.').lower() or 'csv'
+    if format not in FORMATS:
+        raise click.BadParameter('cannot tell the format of {}, use --format'.format(dest.name))
+    try:
+        exporter = Exporter(kind, format, after_id=after_id, updated_since=updated_since, compress=compress,
+                            batch_size=batch_size or current_app.config['EXPORT_BATCH_SIZE'],
+                            lag=current_app.config['EXPORT_WATERMARK_LAG'])
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    for chunk in exporter.chunks():
+        dest.write(chunk)
+    watermarks = exporter.watermarks()
+    click.echo('Exported {} {}. Next run: --after-id {} --updated-since {}'.format(
+        exporter.exported, kind, watermarks['after_id'], watermarks['updated_since'].isoformat()), err=True)
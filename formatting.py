@@ -0,0 +1,55 @@
+from datetime import datetime
+from functools import lru_cache
+import babel.dates
+from babel import Locale
+
+
+#----------------------------------------------------------------------------#
+# Datetime formatting.
+#
+# Used by the views and the `datetime` Jinja filter. Babel patterns and
+# locales are parsed once per (format, locale) and repeated timestamps (a
+# venue's weekly residency, the same show on several pages) are served from
+# an LRU cache instead of being formatted again.
+#----------------------------------------------------------------------------#
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# Babel's own named formats, which are not plain patterns.
+BABEL_FORMATS = ('long', 'short')
+
+FORMAT_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def compile_format(format, locale):
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def _format(value, format, locale):
+    if format in BABEL_FORMATS:
+        return babel.dates.format_datetime(value, format, locale=locale)
+    pattern, locale = compile_format(format, locale)
+    if value.tzinfo is None:
+        # What babel.dates.format_datetime() does with naive values as well.
+        value = value.replace(tzinfo=babel.dates.UTC)
+    return pattern.apply(value, locale)
+
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        # Not ISO 8601, which is rare: dateutil is only imported then.
+        import dateutil.parser
+        return dateutil.parser.parse(value)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    return _format(to_datetime(value), format, locale)
@@ -0,0 +1,113 @@
+import csv
+import re
+import threading
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, bindparam, or_
+from cache import response_cache
+from models import db, Venue
+
+
+#----------------------------------------------------------------------------#
+# Gazetteer.
+#
+# Venues are placed at the centroid of their (city, state), looked up in a
+# local file: no network geocoder, and the same answer every time. The file
+# (GAZETTEER_FILE) is either a CSV with city,state,latitude,longitude
+# columns (the default, data/gazetteer.csv, covers the main US cities) or a
+# US Census Bureau places gazetteer (tab separated, USPS, NAME, INTPTLAT,
+# INTPTLONG). It is loaded on the first lookup.
+#----------------------------------------------------------------------------#
+
+# Suffixes of the Census Bureau place names ("Springfield city").
+CENSUS_SUFFIX = re.compile(r'\s+(city|town|village|borough|CDP|municipality|'
+                           r'(unified|consolidated|metropolitan) government.*|\(balance\))$')
+
+
+def normalize(city):
+    # 'St. Louis', 'st louis' and 'Saint  Louis' are the same place.
+    city = ' '.join(city.replace('.', ' ').casefold().split())
+    return re.sub(r'^(st|ste) ', lambda m: 'saint ' if m.group(1) == 'st' else 'sainte ', city)
+
+
+def read_gazetteer(path):
+    # Yields (city, state, latitude, longitude).
+    with open(path, newline='', encoding='utf-8') as f:
+        dialect = 'excel-tab' if f.readline().count('\t') else 'excel'
+        f.seek(0)
+        for row in csv.DictReader(f, dialect=dialect):
+            row = {key.strip(): value.strip() for key, value in row.items() if key}
+            if 'USPS' in row:
+                yield (CENSUS_SUFFIX.sub('', row['NAME']), row['USPS'],
+                       float(row['INTPTLAT']), float(row['INTPTLONG']))
+            else:
+                yield row['city'], row['state'], float(row['latitude']), float(row['longitude'])
+
+
+class Gazetteer(object):
+
+    def __init__(self, app=None):
+        self.path = None
+        self._places = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config['GAZETTEER_FILE']
+        self._places = None
+        app.cli.add_command(geocode_command)
+
+    def places(self):
+        with self._lock:
+            if self._places is None:
+                self._places = {(normalize(city), state.upper()): (latitude, longitude)
+                                for city, state, latitude, longitude in read_gazetteer(self.path)}
+            return self._places
+
+    def locate(self, city, state):
+        # (latitude, longitude), or (None, None) for a place it doesn't know.
+        if not city or not state:
+            return None, None
+        return self.places().get((normalize(city), state.upper()), (None, None))
+
+
+gazetteer = Gazetteer()
+
+
+#----------------------------------------------------------------------------#
+# Backfill.
+#----------------------------------------------------------------------------#
+
+def geocode_venues(everything=False):
+    # One UPDATE per distinct (city, state), in a single transaction. Returns
+    # the number of venues located, and of venues left without coordinates.
+    unlocated = or_(Venue.latitude.is_(None), Venue.longitude.is_(None))
+    query = db.session.query(Venue.city, Venue.state).distinct()
+    if not everything:
+        query = query.filter(unlocated)
+    update = Venue.__table__.update() \
+        .where(and_(Venue.city == bindparam('area_city'), Venue.state == bindparam('area_state')))
+    if not everything:
+        update = update.where(unlocated)
+    updated = 0
+    for city, state in query.all():
+        latitude, longitude = gazetteer.locate(city, state)
+        if latitude is not None:
+            updated += db.session.execute(update, {'area_city': city, 'area_state': state,
+                                                   'latitude': latitude, 'longitude': longitude}).rowcount
+    db.session.commit()
+    if updated:
+        response_cache.invalidate('venues')
+    return updated, db.session.query(Venue.id).filter(unlocated).count()
+
+
+@click.command('geocode-venues')
+@click.option('--all', 'everything', is_flag=True, help='Locate every venue again, not only the missing ones.')
+@with_appcontext
+def geocode_command(everything):
+    """Set the venues' coordinates from the gazetteer."""
+    updated, missing = geocode_venues(everything)
+    click.echo('Located {} venue(s) from {}.'.format(updated, gazetteer.path))
+    if missing:
+        click.echo('{} venue(s) are in a place the gazetteer does not list.'.format(missing), err=True)
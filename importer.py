@@ -0,0 +1,325 @@
+import csv
+import io
+import json
+import os
+import sys
+from datetime import timedelta
+import click
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+import counters
+from auth import admin_required
+from cache import response_cache, show_tags
+from forms import VenueForm, ArtistForm, ShowForm
+from geocoding import gazetteer
+from models import db, Venue, Artist, Show
+from queries import booking_conflict
+
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Rows are stream-parsed from CSV or NDJSON, validated with the same forms as
+# the create pages and inserted a chunk at a time: one multi-row INSERT and
+# one commit per chunk (see SQLALCHEMY_ENGINE_OPTIONS). Shows may reference
+# their venue and artist by id or by exact name; both are resolved with one
+# query per chunk. Bad rows are reported with their line number and never
+# block the rest of the file.
+#----------------------------------------------------------------------------#
+
+FORMATS = ('csv', 'ndjson')
+
+# Separator of multi-valued cells (genres) in CSV files.
+CSV_LIST_SEPARATOR = ';'
+
+
+def read_rows(stream, format):
+    # Yields (line number, row dict) from a text stream.
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            genres = row.get('genres')
+            if genres is not None:
+                row['genres'] = [g.strip() for g in genres.split(CSV_LIST_SEPARATOR) if g.strip()]
+            yield reader.line_num, row
+    elif format == 'ndjson':
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+                continue
+            yield line_num, row if isinstance(row, dict) else ValueError('Not a JSON object')
+    else:
+        raise ValueError('Unknown format {!r}'.format(format))
+
+
+def form_data(row):
+    # A row as the form data of a WTForms form.
+    data = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            data.setlist(key, [str(v) for v in value])
+        elif value is not None:
+            data[key] = str(value)
+    return data
+
+
+def _validate(form_class, row):
+    form = form_class(formdata=form_data(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    return form, None
+
+
+def venue_values(form):
+    seeking_talent = form.seeking_talent.data != 'No'
+    latitude, longitude = gazetteer.locate(form.city.data, form.state.data)
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'address': form.address.data,
+        'latitude': latitude,
+        'longitude': longitude,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'image_link': form.image_link.data or None,
+        'facebook_link': form.facebook_link.data,
+        'website': form.website.data,
+        'seeking_talent': seeking_talent,
+        'seeking_description': form.seeking_description.data if seeking_talent else None,
+    }
+
+
+def artist_values(form):
+    seeking_venue = form.seeking_venue.data != 'No'
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'image_link': form.image_link.data or None,
+        'facebook_link': form.facebook_link.data,
+        'website': form.website.data,
+        'seeking_venue': seeking_venue,
+        'seeking_description': form.seeking_description.data if seeking_venue else None,
+    }
+
+
+def show_values(form, row):
+    # Ids or names stay unresolved until the chunk is flushed.
+    return {
+        'venue_id': form.venue_id.data or None,
+        'venue_name': row.get('venue_name'),
+        'artist_id': form.artist_id.data or None,
+        'artist_name': row.get('artist_name'),
+        'start_time': form.start_time.data,
+        'end_time': form.start_time.data + timedelta(minutes=form.duration.data),
+    }
+
+
+class Importer(object):
+
+    KINDS = {
+        'venues': (Venue, VenueForm),
+        'artists': (Artist, ArtistForm),
+        'shows': (Show, ShowForm),
+    }
+
+    def __init__(self, kind, chunk_size=1000, max_errors=None):
+        if kind not in self.KINDS:
+            raise ValueError('Unknown kind {!r}'.format(kind))
+        self.kind = kind
+        self.model, self.form_class = self.KINDS[kind]
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, stream, format):
+        chunk = []
+        for line_num, row in read_rows(stream, format):
+            if isinstance(row, Exception):
+                self._error(line_num, {'row': [str(row)]})
+                continue
+            if self.kind == 'shows' and row.get('duration') in ('', None):
+                # An empty cell takes the default duration.
+                row.pop('duration', None)
+            form, errors = _validate(self.form_class, row)
+            if self.kind == 'shows' and not row.get('start_time'):
+                # ShowForm would silently default it to today.
+                errors = dict(errors or {}, start_time=['This field is required.'])
+            if errors:
+                self._error(line_num, errors)
+                continue
+            if self.kind == 'venues':
+                values = venue_values(form)
+            elif self.kind == 'artists':
+                values = artist_values(form)
+            else:
+                values = show_values(form, row)
+            chunk.append((line_num, values))
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+        return self
+
+    def report(self):
+        return {
+            'kind': self.kind,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+    def _error(self, line_num, errors):
+        self.failed += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_num, 'errors': errors})
+
+    def _flush(self, chunk):
+        if self.kind == 'shows':
+            chunk = self._resolve(chunk)
+            if not chunk:
+                return
+        rows = [values for _, values in chunk]
+        try:
+            db.session.execute(self.model.__table__.insert(), rows)
+            self._after_insert(rows)
+            db.session.commit()
+        except SQLAlchemyError:
+            # Find the offending rows one savepoint at a time.
+            db.session.rollback()
+            rows = []
+            for line_num, values in chunk:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(self.model.__table__.insert(), [values])
+                    rows.append(values)
+                except SQLAlchemyError as e:
+                    conflict = booking_conflict(e)
+                    if conflict is not None:
+                        self._error(line_num, {'start_time': ['The {} is already booked at that time.'.format(conflict)]})
+                    else:
+                        self._error(line_num, {'row': [str(getattr(e, 'orig', e)).strip()]})
+            self._after_insert(rows)
+            db.session.commit()
+        self.inserted += len(rows)
+        self._invalidate(rows)
+
+    def _after_insert(self, rows):
+        if self.kind == 'shows' and rows:
+            counters.recount('Venue', {row['venue_id'] for row in rows})
+            counters.recount('Artist', {row['artist_id'] for row in rows})
+
+    def _invalidate(self, rows):
+        if self.kind == 'shows':
+            tags = {tag for row in rows for tag in show_tags(row['venue_id'], row['artist_id'])}
+            response_cache.invalidate(*tags)
+        elif rows:
+            response_cache.invalidate(self.kind)
+
+    def _resolve(self, chunk):
+        # Replace venue/artist references by ids: one query per model for the
+        # whole chunk. Rows that do not resolve to exactly one row are reported.
+        resolved = []
+        lookups = {}
+        for prefix, model in (('venue', Venue), ('artist', Artist)):
+            ids, names = set(), set()
+            for _, values in chunk:
+                ref = values[prefix + '_id']
+                if ref is not None:
+                    try:
+                        values[prefix + '_id'] = int(ref)
+                        ids.add(values[prefix + '_id'])
+                    except ValueError:
+                        pass
+                elif values[prefix + '_name']:
+                    names.add(values[prefix + '_name'])
+            existing = {id for id, in db.session.query(model.id).filter(model.id.in_(ids), model.listed())} \
+                if ids else set()
+            by_name = {}
+            if names:
+                for id, name in db.session.query(model.id, model.name).filter(model.name.in_(names), model.listed()):
+                    by_name[name] = None if name in by_name else id
+            lookups[prefix] = existing, by_name
+
+        for line_num, values in chunk:
+            errors = {}
+            for prefix in ('venue', 'artist'):
+                existing, by_name = lookups[prefix]
+                ref, name = values[prefix + '_id'], values.pop(prefix + '_name')
+                if ref is None and name:
+                    if by_name.get(name) is None:
+                        errors[prefix] = ['{} {!r} not found or ambiguous'.format(prefix.title(), name)]
+                    else:
+                        values[prefix + '_id'] = by_name[name]
+                elif ref is None:
+                    errors[prefix] = ['Either {0}_id or {0}_name is required'.format(prefix)]
+                elif ref not in existing:
+                    errors[prefix] = ['{} {} does not exist'.format(prefix.title(), ref)]
+            if errors:
+                self._error(line_num, errors)
+            else:
+                resolved.append((line_num, values))
+        return resolved
+
+
+#----------------------------------------------------------------------------#
+# Upload endpoint and command.
+#----------------------------------------------------------------------------#
+
+imports = Blueprint('imports', __name__)
+
+
+@imports.route('/import/<kind>', methods=['POST'])
+@admin_required
+def import_upload(kind):
+    # multipart upload in the `file` field; the format comes from ?format=
+    # or the file extension. Returns the import report as JSON, or a 401
+    # without the ADMIN_TOKEN in the X-Admin-Token header.
+    upload = request.files.get('file')
+    if kind not in Importer.KINDS or upload is None:
+        abort(400)
+    format = request.args.get('format') or os.path.splitext(upload.filename or '')[1].lstrip('.').lower()
+    if format not in FORMATS:
+        abort(400)
+    importer = Importer(kind,
+                        chunk_size=current_app.config['IMPORT_CHUNK_SIZE'],
+                        max_errors=current_app.config['IMPORT_MAX_REPORTED_ERRORS'])
+    importer.run(io.TextIOWrapper(upload.stream, encoding='utf-8', newline=''), format)
+    return jsonify(importer.report())
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(Importer.KINDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', type=int, default=None, help='Rows per INSERT/transaction.')
+@click.option('--report', type=click.File('w'), default=None,
+              help='Write one JSON line per rejected row to this file.')
+@with_appcontext
+def import_command(kind, source, format, chunk_size, report):
+    """Bulk load venues, artists or shows from a CSV or NDJSON file.
+
+    Use - as SOURCE to read standard input. CSV files carry one column per
+    form field with genres separated by semicolons. Shows reference their
+    venue and artist with venue_id/artist_id or venue_name/artist_name.
+    """
+    format = format or os.path.splitext(source.name)[1].lstrip('.').lower()
+    if format not in FORMATS:
+        raise click.BadParameter('cannot tell the format of {}, use --format'.format(source.name))
+    importer = Importer(kind, chunk_size=chunk_size or current_app.config['IMPORT_CHUNK_SIZE'])
+    importer.run(source, format)
+    for error in importer.report()['errors']:
+        click.echo(json.dumps(error), file=report or sys.stderr)
+    click.echo('Imported {} {}, rejected {} row(s).'.format(importer.inserted, kind, importer.failed))
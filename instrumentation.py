@@ -0,0 +1,162 @@
+import heapq
+import logging
+import time
+from collections import defaultdict
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from logs import json_file_handler, queued
+
+
+#----------------------------------------------------------------------------#
+# SQL instrumentation.
+#
+# Engine events record, per request, the number of statements, the time spent
+# in the database and the slowest statements. A statement issued many times
+# with different parameters in one request is an N+1 (a lazy load in a loop).
+# Every response gets a Server-Timing header; slow requests, slow statements
+# and N+1s are logged to SLOW_REQUEST_LOG as JSON lines (see logs.py).
+#----------------------------------------------------------------------------#
+
+logger = logging.getLogger('fyyur.slow_requests')
+
+# Longest statement text kept in the log.
+MAX_STATEMENT_LENGTH = 1000
+
+
+class RequestStats(object):
+
+    def __init__(self, slowest=3, repeats=5):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.slowest = []
+        self.keep_slowest = slowest
+        self.repeats = repeats
+        # statement -> hashes of its first `repeats` distinct parameter sets,
+        # and how many times it ran
+        self._seen = defaultdict(set)
+        self._runs = defaultdict(int)
+
+    def record(self, statement, parameters, duration, executemany=False):
+        self.statements += 1
+        self.db_time += duration
+        entry = (duration, self.statements, statement)
+        if len(self.slowest) < self.keep_slowest:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+        # An executemany is no N+1, and its parameters can be a whole chunk
+        # of an upload: keep nothing of them.
+        if executemany:
+            return
+        self._runs[statement] += 1
+        seen = self._seen[statement]
+        if len(seen) < self.repeats:
+            seen.add(hash(repr(parameters)))
+
+    def repeated(self):
+        # (statement, runs) of the statements run with `repeats` distinct
+        # parameter sets or more.
+        return sorted(((statement, self._runs[statement]) for statement, parameters in self._seen.items()
+                       if len(parameters) >= self.repeats), key=lambda item: -item[1])
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def _compact(statement):
+    statement = ' '.join(statement.split())
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        statement = statement[:MAX_STATEMENT_LENGTH] + '...'
+    return statement
+
+
+class Instrumentation(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_INSTRUMENTATION', True)
+        app.config.setdefault('SERVER_TIMING_HEADER', True)
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('SLOWEST_STATEMENTS', 3)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('SLOW_REQUEST_LOG', None)
+        if not app.config['SQL_INSTRUMENTATION']:
+            return
+        self.app = app
+        if app.config['SLOW_REQUEST_LOG']:
+            logger.addHandler(queued(json_file_handler(app.config['SLOW_REQUEST_LOG'],
+                                                       app.config.get('LOG_MAX_BYTES', 0),
+                                                       app.config.get('LOG_BACKUP_COUNT', 5))))
+            logger.setLevel(logging.INFO)
+        # Every engine: GET requests may be served by a replica. The
+        # listeners are global, so only added by the first app.
+        for name, listener in (('before_cursor_execute', self._before_cursor_execute),
+                               ('after_cursor_execute', self._after_cursor_execute),
+                               ('handle_error', self._handle_error)):
+            if not event.contains(Engine, name, listener):
+                event.listen(Engine, name, listener)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        if has_request_context():
+            stats = g.get('request_stats')
+            if stats is not None:
+                stats.record(statement, parameters, time.perf_counter() - started, executemany)
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute: drop its
+        # start time, which would otherwise stay on the pooled connection.
+        if context.execution_context is not None and not context.is_disconnect:
+            started = context.connection.info.get('query_started')
+            if started:
+                started.pop()
+
+    def _start(self):
+        g.request_stats = RequestStats(current_app.config['SLOWEST_STATEMENTS'],
+                                       current_app.config['N_PLUS_ONE_THRESHOLD'])
+
+    def _finish(self, response):
+        # Streamed bodies are still to be rendered: only the queries run by
+        # the view itself are counted.
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        config = current_app.config
+        elapsed = stats.elapsed()
+        repeated = stats.repeated()
+        if config['SERVER_TIMING_HEADER']:
+            timings = ['db;dur={:.2f};desc="{} queries"'.format(stats.db_time * 1000, stats.statements),
+                       'app;dur={:.2f}'.format((elapsed - stats.db_time) * 1000)]
+            if repeated:
+                timings.append('n1;desc="{} repeated statements"'.format(len(repeated)))
+            response.headers.add('Server-Timing', ', '.join(timings))
+
+        slow_queries = [entry for entry in stats.slowest if entry[0] * 1000 >= config['SLOW_QUERY_MS']]
+        if elapsed * 1000 >= config['SLOW_REQUEST_MS'] or slow_queries or repeated:
+            logger.warning('slow request', extra={'fields': {
+                'query_string': request.query_string.decode('latin-1'),
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'statements': stats.statements,
+                'db_ms': round(stats.db_time * 1000, 2),
+                'slowest': [{'ms': round(duration * 1000, 2), 'sql': _compact(statement)}
+                            for duration, _, statement in sorted(stats.slowest, reverse=True)],
+                'n_plus_one': [{'count': count, 'sql': _compact(statement)}
+                               for statement, count in repeated],
+            }})
+        return response
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,245 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+
+#----------------------------------------------------------------------------#
+# Logging pipeline.
+#
+# Request threads only put records on a bounded in-memory queue; a listener
+# thread per log file formats them as JSON lines and appends them to the file.
+# Worker processes share the file, so it is rotated outside of them (e.g. by
+# logrotate) and reopened once moved; only a single process may rotate it
+# itself, by size. When the queue is full records are dropped rather than
+# blocking the request. Threads do not survive a fork: a worker forked from a
+# preloaded app starts its own listeners. Repeats of an exception (same type,
+# raised from the same line) are suppressed for LOG_DUPLICATE_WINDOW seconds;
+# the next record let through carries the number suppressed.
+#----------------------------------------------------------------------------#
+
+REQUEST_ID_HEADER = 'X-Request-Id'
+
+# A client supplied request id is kept when it looks like one.
+REQUEST_ID_PATTERN = re.compile(r'^[\w.-]{1,64}$')
+
+CONTEXT_FIELDS = ('request_id', 'method', 'path', 'endpoint')
+
+# Distinct duplicate keys tracked at once.
+MAX_DUPLICATE_KEYS = 1000
+
+_listeners = []
+
+
+class RequestContextFilter(logging.Filter):
+    # Runs on the request thread, while the request context is still there.
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+        return True
+
+
+class DuplicateFilter(logging.Filter):
+    # Lets one record per exception site (or per message, for errors logged
+    # without one) through every `window` seconds.
+
+    def __init__(self, window=60):
+        logging.Filter.__init__(self)
+        self.window = window
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR and not record.exc_info:
+            return True
+        key = self._key(record)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self.window:
+                seen[1] += 1
+                return False
+            if seen is None and len(self._seen) >= MAX_DUPLICATE_KEYS:
+                self._expire(now)
+            record.suppressed = seen[1] if seen else 0
+            self._seen[key] = [now, 0]
+        return True
+
+    def _key(self, record):
+        if record.exc_info and record.exc_info[2] is not None:
+            tb = record.exc_info[2]
+            while tb.tb_next is not None:
+                tb = tb.tb_next
+            return record.exc_info[0].__name__, tb.tb_frame.f_code.co_filename, tb.tb_lineno
+        return record.name, record.levelno, str(record.msg)
+
+    def _expire(self, now):
+        for key, (since, _) in list(self._seen.items()):
+            if now - since >= self.window:
+                del self._seen[key]
+        if len(self._seen) >= MAX_DUPLICATE_KEYS:
+            self._seen.clear()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+
+    def __init__(self, queue):
+        QueueHandler.__init__(self, queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Render the message and traceback now: the arguments and frames they
+        # refer to move on with the request. The JSON is built by the writer.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        data.update(getattr(record, 'fields', {}))
+        if getattr(record, 'suppressed', 0):
+            data['suppressed'] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+def queued(handler, queue_size=10000):
+    # A handler that hands records to `handler` on a background thread.
+    records = queue.Queue(queue_size)
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    queue_handler = NonBlockingQueueHandler(records)
+    queue_handler.addFilter(RequestContextFilter())
+    _listeners.append((listener, queue_handler))
+    return queue_handler
+
+
+def json_file_handler(path, max_bytes=0, backup_count=0):
+    # Rotated at max_bytes, or with none left to rotation by another
+    # process. The workers of a server each rotating the file they share
+    # would write to each other's backups.
+    if max_bytes:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    else:
+        handler = WatchedFileHandler(path, delay=True)
+    handler.setFormatter(JSONFormatter())
+    return handler
+
+
+@atexit.register
+def _stop_listeners():
+    # Flush what is still queued.
+    while _listeners:
+        try:
+            _listeners.pop()[0].stop()
+        except queue.Full:
+            pass
+
+
+def _restart_listeners():
+    # In a forked child: the listener threads are gone and the queues' locks
+    # may have been held by them. Records queued before the fork are the
+    # parent's to write.
+    for listener, queue_handler in _listeners:
+        records = queue.Queue(listener.queue.maxsize)
+        listener.queue = queue_handler.queue = records
+        listener._thread = None
+        listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_listeners)
+
+
+class LogPipeline(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_FILE', None)
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('LOG_MAX_BYTES', 0)
+        app.config.setdefault('LOG_BACKUP_COUNT', 5)
+        app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('LOG_DUPLICATE_WINDOW', 60)
+        app.config.setdefault('LOG_REQUESTS', True)
+        self.app = app
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if not app.config['LOG_FILE']:
+            return
+        self.handler = queued(json_file_handler(app.config['LOG_FILE'], app.config['LOG_MAX_BYTES'],
+                                                app.config['LOG_BACKUP_COUNT']),
+                              app.config['LOG_QUEUE_SIZE'])
+        self.handler.addFilter(DuplicateFilter(app.config['LOG_DUPLICATE_WINDOW']))
+        for logger in (app.logger, logging.getLogger('fyyur.requests')):
+            logger.addHandler(self.handler)
+            logger.setLevel(app.config['LOG_LEVEL'])
+        if not app.debug:
+            # Flask's own handler writes to stderr on the request thread.
+            app.logger.removeHandler(default_handler)
+
+    def _start(self):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    def _finish(self, response):
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        if self.handler is not None and self.app.config['LOG_REQUESTS']:
+            fields = {
+                'status': response.status_code,
+                'latency_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+            }
+            stats = g.get('request_stats')
+            if stats is not None:
+                fields['statements'] = stats.statements
+                fields['db_ms'] = round(stats.db_time * 1000, 2)
+            logging.getLogger('fyyur.requests').info('request', extra={'fields': fields})
+        return response
+
+
+log_pipeline = LogPipeline()
@@ -0,0 +1,37 @@
+"""trigram search indexes
+
+Revision ID: 4a06f5c188bc
+Revises: 8023983df9ac
+Create Date: 2026-10-18 09:12:41.220514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a06f5c188bc'
+down_revision = '8023983df9ac'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ILIKE '%term%' and similarity() ranking in queries.search() are served
+    # by these GIN trigram indexes instead of a sequential scan.
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venue_name_trgm', 'Venue', ['name'], postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_venue_city_trgm', 'Venue', ['city'], postgresql_using='gin',
+                    postgresql_ops={'city': 'gin_trgm_ops'})
+    op.create_index('ix_artist_name_trgm', 'Artist', ['name'], postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artist_city_trgm', 'Artist', ['city'], postgresql_using='gin',
+                    postgresql_ops={'city': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artist_city_trgm', table_name='Artist')
+    op.drop_index('ix_artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_venue_city_trgm', table_name='Venue')
+    op.drop_index('ix_venue_name_trgm', table_name='Venue')
@@ -0,0 +1,42 @@
+"""hot path composite indexes
+
+Revision ID: 554ef65aaf6a
+Revises: e43e534c4f6b
+Create Date: 2026-10-18 13:41:05.316240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '554ef65aaf6a'
+down_revision = 'e43e534c4f6b'
+branch_labels = None
+depends_on = None
+
+# name, table, columns
+INDEXES = (
+    # venue/artist detail pages: shows of one entity by time
+    ('ix_show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_show_artist_id_start_time', 'Show', ['artist_id', 'start_time']),
+    # /shows keyset pagination and the counters rollover range
+    ('ix_show_start_time_id', 'Show', ['start_time', 'id']),
+    # /venues area pages: covers the (city, state) partition, its name order
+    # and every selected column
+    ('ix_venue_city_state_name', 'Venue', ['city', 'state', 'name', 'id']),
+)
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; it builds
+    # without blocking writes to the tables.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
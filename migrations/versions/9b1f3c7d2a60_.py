@@ -0,0 +1,28 @@
+"""updated_at on Venue, Artist and Show
+
+Revision ID: 9b1f3c7d2a60
+Revises: 554ef65aaf6a
+Create Date: 2026-10-18 14:52:10.418933
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1f3c7d2a60'
+down_revision = '554ef65aaf6a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # now() is stable: existing rows get the migration time without a
+    # table rewrite.
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,72 @@
+"""show end times and double booking constraints
+
+Revision ID: b7d3e09a4c15
+Revises: f3a91d0c57e2
+Create Date: 2026-10-18 19:32:40.281665
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e09a4c15'
+down_revision = 'f3a91d0c57e2'
+branch_labels = None
+depends_on = None
+
+# name, id column
+BOOKINGS = (
+    ('ex_show_venue_booking', 'venue_id'),
+    ('ex_show_artist_booking', 'artist_id'),
+)
+
+# Existing shows get the default duration of the show form.
+DEFAULT_DURATION = "interval '120 minutes'"
+
+# (show, older show of the same venue or artist it overlaps). Every show
+# lasts DEFAULT_DURATION at this point, which bounds the start times to
+# compare.
+OVERLAPS = '''
+    SELECT s.id, o.id FROM "Show" AS s JOIN "Show" AS o
+      ON o.id < s.id
+     AND (o.venue_id = s.venue_id OR o.artist_id = s.artist_id)
+     AND o.start_time > s.start_time - {duration}
+     AND o.start_time < s.start_time + {duration}
+'''.format(duration=DEFAULT_DURATION)
+
+
+def unbook_overlaps(conn):
+    # Existing double bookings are resolved in favor of the older show: the
+    # newer one keeps its start time but no duration, an empty range that
+    # collides with nothing.
+    older = {}
+    for show_id, older_id in conn.execute(sa.text(OVERLAPS)):
+        older.setdefault(show_id, []).append(older_id)
+    unbooked = set()
+    for show_id in sorted(older):
+        if any(older_id not in unbooked for older_id in older[show_id]):
+            unbooked.add(show_id)
+    if unbooked:
+        conn.execute(sa.text('UPDATE "Show" SET end_time = start_time WHERE id = ANY(:ids)'),
+                     ids=sorted(unbooked))
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "Show" SET end_time = start_time + {}'.format(DEFAULT_DURATION))
+    unbook_overlaps(op.get_bind())
+    op.alter_column('Show', 'end_time', nullable=False)
+    op.create_check_constraint('ck_show_end_time', 'Show', 'end_time >= start_time')
+    # Builds a GiST index each, under an exclusive lock on Show.
+    for name, column in BOOKINGS:
+        op.execute('''ALTER TABLE "Show" ADD CONSTRAINT {} EXCLUDE USING gist
+                      (int4range({column}, {column}, '[]') WITH &&, tsrange(start_time, end_time) WITH &&)'''
+                   .format(name, column=column))
+
+
+def downgrade():
+    for name, _ in reversed(BOOKINGS):
+        op.drop_constraint(name, 'Show')
+    op.drop_constraint('ck_show_end_time', 'Show')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,52 @@
+"""genres as varchar arrays with GIN indexes
+
+Revision ID: c4e8a2f61b37
+Revises: 9b1f3c7d2a60
+Create Date: 2026-10-18 16:20:44.102938
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2f61b37'
+down_revision = '9b1f3c7d2a60'
+branch_labels = None
+depends_on = None
+
+# name, table
+INDEXES = (
+    ('ix_venue_genres', 'Venue'),
+    ('ix_artist_genres', 'Artist'),
+)
+
+# The first migrations created genres as plain varchar, which received the
+# array literals the app writes ('{Jazz,Rock}'); anything else is taken as a
+# comma separated list.
+TO_ARRAY = '''CASE WHEN left(genres, 1) = '{' THEN genres::varchar(120)[]
+                   ELSE string_to_array(nullif(genres, ''), ',')::varchar(120)[] END'''
+
+
+def is_array(table):
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return any(column['name'] == 'genres' and isinstance(column['type'], sa.ARRAY) for column in columns)
+
+
+def upgrade():
+    for _, table in INDEXES:
+        if not is_array(table):
+            op.alter_column(table, 'genres', type_=postgresql.ARRAY(sa.String(length=120)),
+                            postgresql_using=TO_ARRAY)
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(name, table, ['genres'], postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    for _, table in INDEXES:
+        op.alter_column(table, 'genres', type_=sa.String(length=120), postgresql_using='genres::varchar(120)')
@@ -0,0 +1,52 @@
+"""soft deleted venues and cascading show foreign keys
+
+Revision ID: d2c6a8e41f07
+Revises: b7d3e09a4c15
+Create Date: 2026-10-18 21:04:18.530147
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c6a8e41f07'
+down_revision = 'b7d3e09a4c15'
+branch_labels = None
+depends_on = None
+
+# name, column, referenced table
+FOREIGN_KEYS = (
+    ('Show_venue_id_fkey', 'venue_id', 'Venue'),
+    ('Show_artist_id_fkey', 'artist_id', 'Artist'),
+)
+
+
+def replace_foreign_keys(on_delete):
+    # The new keys are added NOT VALID, which is instant, and validated once
+    # the migration's transaction is committed: validating only takes a lock
+    # that lets reads and writes through.
+    for name, column, table in FOREIGN_KEYS:
+        op.drop_constraint(name, 'Show', type_='foreignkey')
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT "{}" FOREIGN KEY ({}) REFERENCES "{}" (id) {} NOT VALID'
+                   .format(name, column, table, on_delete))
+    with op.get_context().autocommit_block():
+        for name, _, _ in FOREIGN_KEYS:
+            op.execute('ALTER TABLE "Show" VALIDATE CONSTRAINT "{}"'.format(name))
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    replace_foreign_keys('ON DELETE CASCADE')
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venue_deleted', 'Venue', ['id'], postgresql_where=sa.text('deleted_at IS NOT NULL'),
+                        postgresql_concurrently=True)
+
+
+# Run `flask purge-deleted` first: the venues still marked deleted would be
+# listed again.
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_venue_deleted', table_name='Venue', postgresql_concurrently=True)
+    replace_foreign_keys('')
+    op.drop_column('Venue', 'deleted_at')
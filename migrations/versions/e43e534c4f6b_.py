@@ -0,0 +1,49 @@
+"""show counters on Venue and Artist
+
+Revision ID: e43e534c4f6b
+Revises: 4a06f5c188bc
+Create Date: 2026-10-18 10:03:27.845116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e43e534c4f6b'
+down_revision = '4a06f5c188bc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('CounterRollover',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO "CounterRollover" (id, rolled_at) VALUES (1, LOCALTIMESTAMP)')
+
+    # Backfill against the watermark just written.
+    for table, column in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute('''
+            UPDATE "{table}" e
+               SET upcoming_shows_count = s.upcoming,
+                   past_shows_count = s.past
+              FROM (SELECT {column} AS id,
+                           count(*) FILTER (WHERE start_time >= c.rolled_at) AS upcoming,
+                           count(*) FILTER (WHERE start_time < c.rolled_at) AS past
+                      FROM "Show", "CounterRollover" c
+                     GROUP BY {column}) s
+             WHERE e.id = s.id
+        '''.format(table=table, column=column))
+
+
+def downgrade():
+    op.drop_table('CounterRollover')
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,27 @@
+"""row versions of venues and artists
+
+Revision ID: e5b19c7f3a28
+Revises: d2c6a8e41f07
+Create Date: 2026-10-18 23:12:40.218364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b19c7f3a28'
+down_revision = 'd2c6a8e41f07'
+branch_labels = None
+depends_on = None
+
+
+# A constant default: the columns are added without rewriting the tables.
+def upgrade():
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
@@ -0,0 +1,33 @@
+"""venue coordinates with a GiST index
+
+Revision ID: f3a91d0c57e2
+Revises: c4e8a2f61b37
+Create Date: 2026-10-18 18:05:12.417301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a91d0c57e2'
+down_revision = 'c4e8a2f61b37'
+branch_labels = None
+depends_on = None
+
+
+# The new columns are empty: `flask geocode-venues` fills them in from the
+# gazetteer once the migration has run.
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venue_location', 'Venue', [sa.text('point(longitude, latitude)')],
+                        postgresql_using='gist', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_venue_location', table_name='Venue', postgresql_concurrently=True)
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -1,20 +1,15 @@
-from flask import Flask
-from flask_migrate import Migrate
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import ARRAY, ExcludeConstraint
+from routing import RoutingSQLAlchemy
 from datetime import datetime
-from config import Config
 
 
 #----------------------------------------------------------------------------#
-# App Config.
+# Extensions, bound to the app by create_app() (app.py).
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+moment = Moment()
+db = RoutingSQLAlchemy()
 
 
 #----------------------------------------------------------------------------#
@@ -23,41 +18,116 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_city_state_name', 'city', 'state', 'name', 'id'),
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venue_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        # R-tree over the venues' locations, for the radius and bounding box
+        # lookups of queries.py.
+        db.Index('ix_venue_location', db.text('point(longitude, latitude)'), postgresql_using='gist'),
+        # The few venues waiting for the purge (purge.py).
+        db.Index('ix_venue_deleted', 'id', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     phone = db.Column(db.String(120))
-    genres= db.Column(db.ARRAY(db.String(120)))
+    genres= db.Column(ARRAY(db.String(120)))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
     website = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='venue', cascade="all, delete-orphan", lazy=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now())
+    # Bumped by every edit: an update made at an older version is a conflict
+    # (version_id_col below; the batch updates of updates.py check it too).
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    # Set when the venue is deleted; the row and its past shows stay until
+    # `flask purge-deleted` removes them.
+    deleted_at = db.Column(db.DateTime)
+    # The database deletes the shows with their venue (ON DELETE CASCADE):
+    # they are not loaded to be deleted one by one.
+    shows = db.relationship('Show', backref='venue', cascade="all, delete-orphan", passive_deletes=True, lazy=True)
+
+    __mapper_args__ = {'version_id_col': version}
+
+    @classmethod
+    def listed(cls):
+        # Criterion of the venues on the site: not deleted.
+        return cls.deleted_at.is_(None)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artist_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres= db.Column(db.ARRAY(db.String(120)))
+    genres= db.Column(ARRAY(db.String(120)))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
     website = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='artist', cascade="all, delete-orphan", lazy=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now())
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    shows = db.relationship('Show', backref='artist', cascade="all, delete-orphan", passive_deletes=True, lazy=True)
+
+    __mapper_args__ = {'version_id_col': version}
+
+    @classmethod
+    def listed(cls):
+        # Artists are not soft deleted.
+        return db.true()
 
 class Show(db.Model):
     __tablename__ = 'Show'
-    
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        # Neither a venue nor an artist can have two shows at the same time.
+        # The ids are compared as one-value ranges: comparing them with = in
+        # a GiST index would take the btree_gist extension.
+        ExcludeConstraint((db.text("int4range(venue_id, venue_id, '[]')"), '&&'),
+                          (db.text('tsrange(start_time, end_time)'), '&&'),
+                          name='ex_show_venue_booking', using='gist'),
+        ExcludeConstraint((db.text("int4range(artist_id, artist_id, '[]')"), '&&'),
+                          (db.text('tsrange(start_time, end_time)'), '&&'),
+                          name='ex_show_artist_booking', using='gist'),
+        db.CheckConstraint('end_time >= start_time', name='ck_show_end_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable = False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable = False)
+    start_time = db.Column(db.DateTime, nullable = False )
+    end_time = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now())
+
+class CounterRollover(db.Model):
+    # Single row (id=1): the instant the show counters on Venue and Artist
+    # were last rolled over. See counters.py.
+    __tablename__ = 'CounterRollover'
+
     id = db.Column(db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable = False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable = False)
-    start_time = db.Column(db.DateTime, nullable = False )
\ No newline at end of file
+    rolled_at = db.Column(db.DateTime, nullable=False)
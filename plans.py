@@ -0,0 +1,187 @@
+import json
+import sys
+from contextlib import contextmanager
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from cache import response_cache
+from models import db
+
+
+#----------------------------------------------------------------------------#
+# Query plan checks.
+#
+# Requests every hot view through the test client, records the SELECTs it
+# issues and runs EXPLAIN on each of them. A plan that falls back to a
+# sequential scan on a large Venue/Artist/Show table means an index is
+# missing or no longer usable. Run it against a database holding a catalog
+# of realistic size (python -m benchmarks.seed): on small tables sequential
+# scans are legitimately chosen. The tests instead EXPLAIN with sequential
+# scans disabled, which leaves one in a plan only where no index can serve
+# the query at all.
+#----------------------------------------------------------------------------#
+
+HOT_TABLES = ('Venue', 'Artist', 'Show')
+
+# Below this many rows a sequential scan is the right plan.
+SEQ_SCAN_MIN_ROWS = 10000
+
+# Disabled by check_plans(force_indexes=True): every row is then reached
+# through an index lookup wherever one can serve the query.
+FORCED_INDEX_SETTINGS = ('enable_seqscan', 'enable_hashjoin', 'enable_mergejoin')
+
+
+def sample_arguments():
+    # Worst-case ids and filters from the current data: the busiest venue,
+    # artist and area (and its center), and a cursor deep into the show
+    # history.
+    row = db.session.execute(text('''
+        SELECT (SELECT venue_id FROM "Show" GROUP BY venue_id ORDER BY count(*) DESC LIMIT 1) AS venue_id,
+               (SELECT artist_id FROM "Show" GROUP BY artist_id ORDER BY count(*) DESC LIMIT 1) AS artist_id,
+               (SELECT start_time FROM "Show" ORDER BY start_time DESC LIMIT 1 OFFSET 100) AS start_time
+    ''')).first()
+    area = db.session.execute(text('''
+        SELECT city, state, avg(latitude) AS latitude, avg(longitude) AS longitude
+        FROM "Venue" GROUP BY city, state ORDER BY count(*) DESC LIMIT 1
+    ''')).first()
+    return {
+        'venue_id': row.venue_id or 1,
+        'artist_id': row.artist_id or 1,
+        'cursor': '{},0'.format(row.start_time.isoformat()) if row.start_time else None,
+        'city': area.city if area else '',
+        'state': area.state if area else '',
+        'lat': area.latitude if area and area.latitude is not None else 0.0,
+        'lng': area.longitude if area and area.longitude is not None else 0.0,
+    }
+
+
+def hot_requests(args):
+    # (method, url, form) for every view on the read path. /artists and the
+    # /venues overview read the whole table by design and are left out,
+    # unless filtered by genre, as are the genre facets of every unfiltered
+    # listing (genre_counts()).
+    requests = [
+        ('GET', '/venues?city={city}&state={state}&page=2&genre=Jazz'.format(**args), None),
+        ('GET', '/venues/{venue_id}'.format(**args), None),
+        ('GET', '/artists/{artist_id}'.format(**args), None),
+        ('GET', '/shows', None),
+        ('GET', '/shows?when=past', None),
+        ('GET', '/venues?genre=Jazz&genre=Folk&match=all', None),
+        ('GET', '/artists?genre=Jazz&genre=Folk&match=all', None),
+        ('POST', '/venues/search', {'search_term': 'hall'}),
+        ('POST', '/artists/search', {'search_term': 'band'}),
+        ('GET', '/api/v1/venues?after=100', None),
+        ('GET', '/api/v1/artists?after=100', None),
+        ('GET', '/api/v1/venues/{venue_id}'.format(**args), None),
+        ('GET', '/api/v1/artists/{artist_id}'.format(**args), None),
+        ('GET', '/api/v1/venues/nearby?lat={lat}&lng={lng}&radius_km=25'.format(**args), None),
+        ('GET', '/api/v1/venues/within?bbox={},{},{},{}'.format(
+            args['lat'] - 0.5, args['lng'] - 0.5, args['lat'] + 0.5, args['lng'] + 0.5), None),
+        ('GET', '/api/v1/venues/{venue_id}/calendar'.format(**args), None),
+        ('GET', '/api/v1/artists/{artist_id}/calendar?view=week'.format(**args), None),
+        ('GET', '/venues/{venue_id}/shows.ics'.format(**args), None),
+        ('GET', '/artists/{artist_id}/shows.ics'.format(**args), None),
+    ]
+    if args['cursor']:
+        requests.append(('GET', '/shows?when=all&after=' + args['cursor'], None))
+    return requests
+
+
+@contextmanager
+def recorded_statements():
+    # On every engine: GET requests may be served by a replica.
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+
+def seq_scans(plan, large_tables, whole_indexes=None):
+    # Walk an EXPLAIN (FORMAT JSON) plan tree. Given whole_indexes (the names
+    # of the partial indexes, which hold few rows), an other index scanned
+    # from end to end (no Index Cond) counts as well: that is what the
+    # planner falls back to when sequential scans are disabled.
+    found = []
+    if plan.get('Relation Name') in large_tables:
+        if plan.get('Node Type') == 'Seq Scan' or (
+                whole_indexes is not None and plan.get('Node Type') in ('Index Scan', 'Index Only Scan')
+                and 'Index Cond' not in plan and plan.get('Index Name') not in whole_indexes):
+            found.append(plan['Relation Name'])
+    for child in plan.get('Plans', ()):
+        found.extend(seq_scans(child, large_tables, whole_indexes))
+    return found
+
+
+def check_plans(min_rows=SEQ_SCAN_MIN_ROWS, force_indexes=False, requests=None):
+    # Returns a list of (request, statement, tables scanned sequentially),
+    # for the hot_requests() by default.
+    sizes = dict(db.session.execute(text('''
+        SELECT relname, reltuples FROM pg_class WHERE relname IN :tables
+    '''), {'tables': HOT_TABLES}).fetchall())
+    large_tables = {table for table, rows in sizes.items() if rows >= min_rows}
+    partial_indexes = None
+    if force_indexes:
+        partial_indexes = {name for name, in db.session.execute(text(
+            'SELECT indexrelid::regclass::text FROM pg_index WHERE indpred IS NOT NULL'))}
+
+    app = current_app._get_current_object()
+    client = app.test_client()
+    failures = []
+    if requests is None:
+        requests = hot_requests(sample_arguments())
+    for method, url, form in requests:
+        with recorded_statements() as statements:
+            response = client.open(url, method=method, data=form)
+            response.get_data()
+        # The requests run inside this command's app context and share its
+        # session: end it here as the app context teardown would.
+        db.session.remove()
+        if response.status_code != 200:
+            failures.append(((method, url), None, ['HTTP {}'.format(response.status_code)]))
+            continue
+        with db.get_engine().connect() as conn:
+            # A transaction, so that the setting ends with it
+            with conn.begin() as transaction:
+                if force_indexes:
+                    for setting in FORCED_INDEX_SETTINGS:
+                        conn.execute('SET LOCAL {} = off'.format(setting))
+                for statement, parameters in statements:
+                    plan = conn.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    tables = seq_scans(plan[0]['Plan'], large_tables, partial_indexes)
+                    if tables:
+                        failures.append(((method, url), statement, tables))
+                transaction.rollback()
+    return failures
+
+
+@click.command('check-plans')
+@click.option('--min-rows', type=int, default=SEQ_SCAN_MIN_ROWS, show_default=True,
+              help='Tables smaller than this may be scanned sequentially.')
+@with_appcontext
+def check_plans_command(min_rows):
+    """EXPLAIN the queries of every hot view and fail on sequential scans."""
+    # Cached pages would issue no queries at all.
+    backend, response_cache.backend = response_cache.backend, None
+    try:
+        failures = check_plans(min_rows)
+    finally:
+        response_cache.backend = backend
+    for (method, url), statement, problems in failures:
+        click.echo('{} {}: {}'.format(method, url, ', '.join('Seq Scan on ' + p if statement else p
+                                                            for p in problems)), err=True)
+        if statement:
+            click.echo('    ' + ' '.join(statement.split()), err=True)
+    if failures:
+        sys.exit(1)
+    click.echo('No sequential scans on tables with {}+ rows.'.format(min_rows))
@@ -0,0 +1,190 @@
+import hmac
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Response, abort, g, jsonify, request
+from auth import admin_required
+
+
+#----------------------------------------------------------------------------#
+# Request profiler.
+#
+# A profiled request is sampled by a background thread that records the
+# request thread's Python stack every PROFILER_INTERVAL seconds, until the
+# response (streamed bodies included) is closed. Each profile is written to
+# PROFILER_DIR/<endpoint>/ in collapsed-stack format ("a;b;c <samples>"), the
+# input of flamegraph.pl and speedscope. Requests are profiled when they send
+# the ADMIN_TOKEN in the X-Profile header, or at random with probability
+# PROFILER_SAMPLE_RATE. Otherwise the cost is one header lookup.
+#----------------------------------------------------------------------------#
+
+PROFILE_HEADER = 'X-Profile'
+
+PROFILE_SUFFIX = '.collapsed'
+
+_sequence = itertools.count(1)
+
+
+def _label(frame):
+    return '{}:{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
+
+
+class Sampler(threading.Thread):
+
+    def __init__(self, thread_id, interval):
+        threading.Thread.__init__(self, name='profiler-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def read_collapsed(path, stacks):
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += int(count)
+
+
+def flame_tree(stacks):
+    # Nested {name, value, children} nodes, as d3-flame-graph expects.
+    root = {'name': 'root', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            child = node['children'].get(name)
+            if child is None:
+                child = node['children'][name] = {'name': name, 'value': 0, 'children': {}}
+            child['value'] += count
+            node = child
+
+    def listify(node):
+        node['children'] = [listify(child) for child in node['children'].values()]
+        return node
+    return listify(root)
+
+
+class Profiler(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMIN_TOKEN', None)
+        app.config.setdefault('PROFILER_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILER_INTERVAL', 0.005)
+        app.config.setdefault('PROFILER_DIR', os.path.join(app.root_path, 'profiles'))
+        app.config.setdefault('PROFILER_MAX_PROFILES', 200)
+        self.app = app
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule('/admin/profiles', 'profiles', admin_required(self.index_view))
+        app.add_url_rule('/admin/profiles/<endpoint>', 'profile', admin_required(self.profile_view))
+
+    def wanted(self):
+        token = self.app.config['ADMIN_TOKEN']
+        requested = request.headers.get(PROFILE_HEADER)
+        if requested is not None and token and hmac.compare_digest(requested, token):
+            return True
+        rate = self.app.config['PROFILER_SAMPLE_RATE']
+        return rate > 0 and random.random() < rate
+
+    def _start(self):
+        if not self.wanted():
+            return
+        sampler = g.profile_sampler = Sampler(threading.get_ident(), self.app.config['PROFILER_INTERVAL'])
+        sampler.start()
+
+    def _finish(self, response):
+        sampler = g.get('profile_sampler')
+        if sampler is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        path = self._path(endpoint)
+        # call_on_close: streamed pages are rendered after this hook returns.
+        response.call_on_close(lambda: self._save(sampler, endpoint, path))
+        response.headers['X-Profile-Id'] = os.path.basename(path)[:-len(PROFILE_SUFFIX)]
+        return response
+
+    def _path(self, endpoint):
+        name = '{}-{}-{}{}'.format(time.strftime('%Y%m%dT%H%M%S'), os.getpid(),
+                                   next(_sequence), PROFILE_SUFFIX)
+        return os.path.join(self._directory(endpoint), name)
+
+    def _directory(self, endpoint):
+        # No separators, and no leading dot: '..' would leave PROFILER_DIR.
+        return os.path.join(self.app.config['PROFILER_DIR'], re.sub(r'[^\w.-]|^\.', '_', endpoint))
+
+    def _save(self, sampler, endpoint, path):
+        sampler.stop()
+        if not sampler.stacks:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            for stack, count in sampler.stacks.items():
+                f.write('{} {}\n'.format(stack, count))
+        self._prune(os.path.dirname(path))
+
+    def _prune(self, directory):
+        # Keep the newest PROFILER_MAX_PROFILES profiles per endpoint.
+        profiles = sorted(os.scandir(directory), key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in profiles[self.app.config['PROFILER_MAX_PROFILES']:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def aggregate(self, endpoint):
+        # (number of profiles, collapsed stacks summed over them)
+        stacks = Counter()
+        directory = self._directory(endpoint)
+        if not os.path.isdir(directory):
+            return 0, stacks
+        paths = [entry.path for entry in os.scandir(directory) if entry.name.endswith(PROFILE_SUFFIX)]
+        for path in paths:
+            read_collapsed(path, stacks)
+        return len(paths), stacks
+
+    def index_view(self):
+        directory = self.app.config['PROFILER_DIR']
+        endpoints = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+        return jsonify({endpoint: len(os.listdir(os.path.join(directory, endpoint)))
+                        for endpoint in endpoints})
+
+    def profile_view(self, endpoint):
+        # ?format=collapsed (default) or json (a flame graph tree).
+        count, stacks = self.aggregate(endpoint)
+        if not count:
+            abort(404)
+        if request.args.get('format') == 'json':
+            return Response(json.dumps(dict(flame_tree(stacks), profiles=count)),
+                            mimetype='application/json')
+        body = ''.join('{} {}\n'.format(stack, samples) for stack, samples in sorted(stacks.items()))
+        return Response(body, mimetype='text/plain')
+
+
+profiler = Profiler()
@@ -0,0 +1,87 @@
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, text
+import counters
+from models import db, Venue, Show
+
+
+#----------------------------------------------------------------------------#
+# Deletes.
+#
+# Deleting a venue takes its shows off the artists' counters and, with
+# SOFT_DELETE, only marks it deleted (Venue.deleted_at), cancels the shows
+# still ahead of it and empties the time range of the past ones, in a
+# statement each: none of them holds its artist's time any more. It is out
+# of every page at once, and the request never loads a show. The purge
+# removes the marked venues and the rest of their shows later, a bounded
+# batch per transaction. Without SOFT_DELETE the venue is deleted on the spot, with
+# its shows, by the foreign keys' ON DELETE CASCADE.
+#----------------------------------------------------------------------------#
+
+# At most :batch_size shows of deleted venues.
+PURGE_SHOWS = '''
+    DELETE FROM "Show" WHERE id IN (
+        SELECT s.id FROM "Venue" v JOIN "Show" s ON s.venue_id = v.id
+         WHERE v.deleted_at IS NOT NULL
+         LIMIT :batch_size)
+'''
+
+# At most :batch_size deleted venues, once their shows are gone.
+PURGE_VENUES = '''
+    DELETE FROM "Venue" WHERE id IN (
+        SELECT id FROM "Venue" WHERE deleted_at IS NOT NULL LIMIT :batch_size)
+'''
+
+
+def remove_venue(venue_id, soft=True):
+    # Call inside the transaction that deletes the venue.
+    rolled_at = counters.forget_shows('venue_id', venue_id)
+    if not soft:
+        db.session.execute(Venue.__table__.delete().where(Venue.id == venue_id))
+        return
+    now = datetime.now()
+    db.session.execute(Venue.__table__.update().where(Venue.id == venue_id).values(deleted_at=now, updated_at=now))
+    # The shows counted as upcoming: they no longer hold their artists'
+    # time, and those left are all in the past, which the counters' rollover
+    # has done with.
+    db.session.execute(Show.__table__.delete()
+                       .where(and_(Show.venue_id == venue_id, Show.start_time >= rolled_at)))
+    # The past ones stay until the purge, with an empty time range, which
+    # the exclusion constraints ignore: they no longer turn down their
+    # artists' bookings elsewhere at the same time.
+    db.session.execute(Show.__table__.update()
+                       .where(and_(Show.venue_id == venue_id, Show.end_time > Show.start_time))
+                       .values(end_time=Show.start_time))
+
+
+def purge_deleted(batch_size, pause=0):
+    # Returns the number of shows and venues removed.
+    removed = {}
+    for name, statement in (('shows', PURGE_SHOWS), ('venues', PURGE_VENUES)):
+        removed[name] = 0
+        while True:
+            count = db.session.execute(text(statement), {'batch_size': batch_size}).rowcount
+            db.session.commit()
+            removed[name] += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+    return removed['shows'], removed['venues']
+
+
+@click.command('purge-deleted')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+@click.option('--pause', type=float, default=0, help='Seconds to wait between two batches.')
+@with_appcontext
+def purge_command(batch_size, pause):
+    """Remove the deleted venues and their shows.
+
+    Schedule this (e.g. nightly from cron, after the exports). Every batch
+    is committed on its own, so that no lock is held for long; --pause lets
+    replicas keep up.
+    """
+    shows, venues = purge_deleted(batch_size or current_app.config['PURGE_BATCH_SIZE'], pause)
+    click.echo('Purged {} venue(s) and {} show(s).'.format(venues, shows))
@@ -0,0 +1,410 @@
+import math
+from datetime import datetime
+from itertools import groupby
+from sqlalchemy import and_, cast, func, or_, text, tuple_
+from sqlalchemy.orm import selectinload
+from models import db, Venue, Artist, Show
+
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+GENRE_MATCHES = ('any', 'all')
+
+
+def genre_filter(model, genres, match='any'):
+    # Rows having any (&&) or all (@>) of the genres. Both operators are
+    # answered by the GIN index on the array, as long as the other side is
+    # cast to the column's own type.
+    genres = cast(list(genres), model.genres.type)
+    return model.genres.contains(genres) if match == 'all' else model.genres.overlap(genres)
+
+
+def genre_counts(model, genres=(), match='any'):
+    # [(genre, rows)] over the rows matching the filter, most common first:
+    # the arrays are unnested and counted by a single aggregate query.
+    genre = func.unnest(model.genres).label('genre')
+    query = db.session.query(genre).filter(model.listed())
+    if genres:
+        query = query.filter(genre_filter(model, genres, match))
+    unnested = query.subquery()
+    rows = func.count().label('rows')
+    return db.session.query(unnested.c.genre, rows) \
+        .group_by(unnested.c.genre) \
+        .order_by(rows.desc(), unnested.c.genre) \
+        .all()
+
+
+#----------------------------------------------------------------------------#
+# Venues.
+#----------------------------------------------------------------------------#
+
+def venue_areas(per_area, page=1, city=None, state=None, genres=(), match='any'):
+    # One round trip: rank the venues inside their (city, state) area with a
+    # window function and keep only the requested page of every area, so a
+    # big city never makes the listing unbounded.
+    area = (Venue.city, Venue.state)
+    ranked = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.updated_at,
+        func.row_number().over(partition_by=area, order_by=(Venue.name, Venue.id)).label('position'),
+        func.count(Venue.id).over(partition_by=area).label('total')) \
+        .filter(Venue.listed())
+    if city is not None:
+        ranked = ranked.filter(Venue.city == city)
+    if state is not None:
+        ranked = ranked.filter(Venue.state == state)
+    if genres:
+        ranked = ranked.filter(genre_filter(Venue, genres, match))
+    ranked = ranked.subquery()
+
+    start = (page - 1) * per_area
+    rows = db.session.query(ranked) \
+        .filter(ranked.c.position > start, ranked.c.position <= start + per_area) \
+        .order_by(ranked.c.state, ranked.c.city, ranked.c.position)
+
+    areas = []
+    for (area_city, area_state), group in groupby(rows, key=lambda row: (row.city, row.state)):
+        group = list(group)
+        total = group[0].total
+        areas.append({
+            'city': area_city,
+            'state': area_state,
+            'venues': [{'id': row.id, 'name': row.name} for row in group],
+            # With the total, identifies the content of the page for the
+            # fragment cache: any insert, delete or edit changes one of them.
+            'updated_at': max(row.updated_at for row in group),
+            'total': total,
+            'page': page,
+            'has_prev': page > 1,
+            'has_next': start + per_area < total
+        })
+    return areas
+
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#
+# Venues are points (longitude, latitude) in a GiST index (ix_venue_location),
+# which answers "inside this box" (<@) without reading the other rows. Radius
+# lookups go through the circle's bounding box, and the exact great-circle
+# distance is only computed for the venues inside it.
+#----------------------------------------------------------------------------#
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def venue_location():
+    # Same expression as the index.
+    return func.point(Venue.longitude, Venue.latitude)
+
+
+def in_boxes(boxes):
+    # boxes: [(south, west, north, east)], in degrees.
+    return or_(*[venue_location().op('<@')(func.box(func.point(west, south), func.point(east, north)))
+                 for south, west, north, east in boxes])
+
+
+def split_box(south, west, north, east):
+    # A box crossing the antimeridian (west > east) is two boxes.
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def radius_box(latitude, longitude, radius_km):
+    # Smallest (south, west, north, east) box containing the circle.
+    south = latitude - radius_km / KM_PER_DEGREE
+    north = latitude + radius_km / KM_PER_DEGREE
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)) \
+        if abs(latitude) < 90 else 1
+    if south <= -90 or north >= 90 or ratio >= 1:
+        # The circle covers a pole, or all longitudes.
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    half_width = math.degrees(math.asin(ratio))
+    west, east = longitude - half_width, longitude + half_width
+    return south, west + 360 if west < -180 else west, north, east - 360 if east > 180 else east
+
+
+def distance_km(latitude, longitude):
+    # Haversine distance from the point, as an SQL expression.
+    dlat = func.radians(Venue.latitude - latitude) / 2
+    dlng = func.radians(Venue.longitude - longitude) / 2
+    a = func.power(func.sin(dlat), 2) + \
+        math.cos(math.radians(latitude)) * func.cos(func.radians(Venue.latitude)) * func.power(func.sin(dlng), 2)
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0)))
+
+
+def _located(latitude, longitude):
+    return db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.address,
+        Venue.latitude,
+        Venue.longitude,
+        distance_km(latitude, longitude).label('distance_km')) \
+        .filter(Venue.listed())
+
+
+def venues_near(latitude, longitude, radius_km, limit):
+    # Venues within radius_km of the point, nearest first.
+    boxes = split_box(*radius_box(latitude, longitude, radius_km))
+    located = _located(latitude, longitude).filter(in_boxes(boxes)).subquery()
+    return db.session.query(located) \
+        .filter(located.c.distance_km <= radius_km) \
+        .order_by(located.c.distance_km, located.c.id) \
+        .limit(limit) \
+        .all()
+
+
+def venues_within(south, west, north, east, limit):
+    # Venues inside the box, nearest to its center first. The index hands
+    # them over nearest first (<->, in degrees), so a box spanning the whole
+    # catalog costs no more than a small one; the page is then sorted by the
+    # exact distance.
+    latitude = (south + north) / 2
+    longitude = west + ((east - west) % 360) / 2
+    longitude = longitude - 360 if longitude > 180 else longitude
+    located = _located(latitude, longitude) \
+        .filter(in_boxes(split_box(south, west, north, east))) \
+        .order_by(venue_location().op('<->')(func.point(longitude, latitude))) \
+        .limit(limit) \
+        .subquery()
+    return db.session.query(located).order_by(located.c.distance_km, located.c.id).all()
+
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search(model, term, limit, offset=0):
+    # Partial, case-insensitive match on name or city. Both predicates and the
+    # similarity() ranking are answered by the pg_trgm GIN indexes, and the
+    # total match count rides along as a window aggregate.
+    pattern = '%{}%'.format(escape_like(term))
+    return db.session.query(model.id,
+                            model.name,
+                            model.upcoming_shows_count,
+                            func.count().over().label('total')) \
+        .filter(or_(model.name.ilike(pattern, escape='\\'),
+                    model.city.ilike(pattern, escape='\\'))) \
+        .filter(model.listed()) \
+        .order_by(func.similarity(model.name, term).desc(), model.name, model.id) \
+        .limit(limit) \
+        .offset(offset) \
+        .all()
+
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+SHOW_WINDOWS = ('upcoming', 'past', 'all')
+
+
+def encode_cursor(row):
+    return '{},{}'.format(row.start_time.isoformat(), row.id)
+
+
+def decode_cursor(cursor):
+    # Raises ValueError on anything encode_cursor() could not have produced.
+    start_time, show_id = cursor.rsplit(',', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+
+
+def show_page(when, limit, after=None, now=None):
+    # Keyset pagination on (start_time, id): each page is an index range scan
+    # that starts right after the cursor, however deep into the history it is.
+    # Past shows are listed most recent first. Fetches one extra row so the
+    # caller can tell whether there is a next page.
+    now = now or datetime.now()
+    key = tuple_(Show.start_time, Show.id)
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.end_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.updated_at,
+        Venue.updated_at.label('venue_updated_at'),
+        Artist.updated_at.label('artist_updated_at')) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .filter(Venue.listed())
+    if when == 'upcoming':
+        query = query.filter(Show.start_time >= now)
+    elif when == 'past':
+        query = query.filter(Show.start_time < now)
+
+    if when == 'past':
+        if after is not None:
+            query = query.filter(key < after)
+        query = query.order_by(Show.start_time.desc(), Show.id.desc())
+    else:
+        if after is not None:
+            query = query.filter(key > after)
+        query = query.order_by(Show.start_time, Show.id)
+    return query.limit(limit + 1).all()
+
+
+# Exclusion constraints on Show (models.py), by the side they protect.
+BOOKING_CONSTRAINTS = {'ex_show_venue_booking': 'venue', 'ex_show_artist_booking': 'artist'}
+
+
+def booking_conflict(error):
+    # 'venue' or 'artist' when an IntegrityError is a double booking.
+    diag = getattr(getattr(error, 'orig', None), 'diag', None)
+    return BOOKING_CONSTRAINTS.get(getattr(diag, 'constraint_name', None))
+
+
+def booked(column, entity_id, start_time, end_time):
+    # Shows of the venue or artist (column is Show.venue_id or
+    # Show.artist_id) overlapping [start_time, end_time), in the terms of the
+    # exclusion constraints, so their GiST indexes answer it. None is
+    # unbounded.
+    return and_(func.int4range(column, column, '[]').op('&&')(func.int4range(entity_id, entity_id, '[]')),
+                func.tsrange(Show.start_time, Show.end_time).op('&&')(func.tsrange(start_time, end_time)))
+
+
+def show_conflicts(venue_id, artist_id, start_time, end_time):
+    # Shows of the venue or of the artist overlapping [start_time, end_time),
+    # at listed venues.
+    return db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.end_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name')) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .filter(or_(booked(Show.venue_id, venue_id, start_time, end_time),
+                    booked(Show.artist_id, artist_id, start_time, end_time)),
+                Venue.listed()) \
+        .order_by(Show.start_time, Show.id) \
+        .all()
+
+
+#----------------------------------------------------------------------------#
+# Calendars.
+#----------------------------------------------------------------------------#
+
+# Every day of [start, end) with the venue's or artist's shows on that day
+# and the time they take, clipped to the day: a show past midnight counts on
+# both days. The shows of the whole range come from one scan of the
+# exclusion constraint's index, on both of its columns.
+CALENDAR_DAYS = '''
+    SELECT day::date AS day,
+           count(s.id) AS shows,
+           coalesce(sum(upper(tsrange(s.start_time, s.end_time) * tsrange(day, day + interval '1 day'))
+                        - lower(tsrange(s.start_time, s.end_time) * tsrange(day, day + interval '1 day'))),
+                    interval '0') AS booked
+    FROM generate_series(:start, :end - interval '1 day', interval '1 day') AS day
+    LEFT JOIN "Show" AS s
+      ON int4range(s.{column}, s.{column}, '[]') && int4range(:entity_id, :entity_id, '[]')
+     AND tsrange(s.start_time, s.end_time) && tsrange(:start, :end)
+     AND tsrange(s.start_time, s.end_time) && tsrange(day, day + interval '1 day')
+     AND s.venue_id NOT IN (SELECT id FROM "Venue" WHERE deleted_at IS NOT NULL)
+    GROUP BY day
+    ORDER BY day
+'''
+
+CALENDAR_COLUMNS = ('venue_id', 'artist_id')
+
+
+def calendar_days(column, entity_id, start, end):
+    # [(day, shows, booked timedelta)] for start <= day < end.
+    if column not in CALENDAR_COLUMNS:
+        raise ValueError(column)
+    return db.session.execute(text(CALENDAR_DAYS.format(column=column)),
+                              {'entity_id': entity_id, 'start': start, 'end': end}).fetchall()
+
+
+def calendar_version(column, entity_id, start, end=None):
+    # (shows, latest change) of the shows overlapping [start, end) with their
+    # venue and artist: what a calendar of them shows, for a fraction of the
+    # cost of building it. A deleted show changes the count.
+    column = getattr(Show, column)
+    return db.session.query(
+        func.count(Show.id),
+        func.max(func.greatest(Show.updated_at, Venue.updated_at, Artist.updated_at))) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .filter(booked(column, entity_id, start, end), Venue.listed()) \
+        .one()
+
+
+def calendar_feed(column, entity_id, start, batch_size):
+    # Shows overlapping [start, ...), in start time order, fetched batch_size
+    # rows at a time from a server-side cursor. A cursor is planned for its
+    # first rows by default: down the start time index of every show,
+    # filtered. The feed is read to the end, so it is planned as a whole, for
+    # the rest of the transaction: from the exclusion constraint's index,
+    # then sorted.
+    db.session.execute(text('SET LOCAL cursor_tuple_fraction = 1'))
+    return db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.end_time,
+        Show.updated_at,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.address,
+        Venue.city,
+        Venue.state,
+        Venue.latitude,
+        Venue.longitude,
+        Show.artist_id,
+        Artist.name.label('artist_name')) \
+        .join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .filter(booked(getattr(Show, column), entity_id, start, None), Venue.listed()) \
+        .order_by(Show.start_time, Show.id) \
+        .yield_per(batch_size)
+
+
+#----------------------------------------------------------------------------#
+# Detail pages.
+#----------------------------------------------------------------------------#
+
+def load_venue(venue_id):
+    # Two round trips whatever the history: the venue, then all of its shows
+    # with their artist joined in (selectinload + joinedload), so reading
+    # show.artist never lazy-loads.
+    return Venue.query \
+        .options(selectinload(Venue.shows).joinedload(Show.artist)) \
+        .filter(Venue.id == venue_id, Venue.listed()) \
+        .first()
+
+
+def load_artist(artist_id):
+    return Artist.query \
+        .options(selectinload(Artist.shows).joinedload(Show.venue)) \
+        .filter(Artist.id == artist_id) \
+        .first()
+
+
+def split_shows(shows, now=None):
+    # Past and upcoming against a single reference timestamp, both in
+    # start_time order. The shows left of a deleted venue are skipped.
+    now = now or datetime.now()
+    past, upcoming = [], []
+    for show in sorted(shows, key=lambda show: (show.start_time, show.id)):
+        if show.venue.deleted_at is None:
+            (upcoming if show.start_time >= now else past).append(show)
+    return past, upcoming
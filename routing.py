@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+import sqlalchemy
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+
+
+#----------------------------------------------------------------------------#
+# Read/write routing.
+#
+# GET and HEAD requests read from one of SQLALCHEMY_REPLICA_URIS (picked per
+# request), everything else - writes, flushes, CLI commands - goes to the
+# primary at SQLALCHEMY_DATABASE_URI. After a write the client gets a cookie
+# that pins its reads to the primary for READ_YOUR_WRITES_SECONDS, so a
+# redirect after POST never shows a page from a replica that is lagging
+# behind.
+#----------------------------------------------------------------------------#
+
+PRIMARY_COOKIE = 'fyyur_primary_until'
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_lock = threading.Lock()
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_request_context():
+            replica = g.get('db_replica')
+            if replica is not None:
+                return replica
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+        SQLAlchemy.init_app(self, app)
+        app.before_request(self._choose_bind)
+        app.after_request(self._pin_after_write)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def replica_engines(self, app=None):
+        # Created on first use, with the primary's engine options.
+        app = self.get_app(app)
+        state = app.extensions['sqlalchemy']
+        engines = getattr(state, 'replicas', None)
+        if engines is None:
+            with _replica_lock:
+                engines = getattr(state, 'replicas', None)
+                if engines is None:
+                    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+                    engines = state.replicas = [sqlalchemy.create_engine(uri, **options)
+                                                for uri in app.config['SQLALCHEMY_REPLICA_URIS']]
+        return engines
+
+    def _choose_bind(self):
+        g.db_replica = None
+        if request.method not in READ_METHODS:
+            return
+        try:
+            pinned_until = float(request.cookies.get(PRIMARY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            return
+        engines = self.replica_engines()
+        if engines:
+            g.db_replica = random.choice(engines)
+
+    def _pin_after_write(self, response):
+        if request.method not in READ_METHODS:
+            seconds = self.get_app().config['READ_YOUR_WRITES_SECONDS']
+            response.set_cookie(PRIMARY_COOKIE, str(time.time() + seconds),
+                                max_age=seconds, httponly=True)
+        return response
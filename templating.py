@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache, Undefined, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from cache import response_cache
+
+
+#----------------------------------------------------------------------------#
+# Template compilation and fragment caching.
+#
+# Compiled templates are kept in a bytecode cache on disk, shared by the
+# workers of a host, and every template is compiled when the app starts, so
+# a fresh worker never compiles on a request. Jinja checks the source
+# checksum, a deploy with changed templates simply recompiles them.
+#
+# {% cache 'show-tile', show.id, show.updated_at %}...{% endcache %} stores
+# the rendered block in the response cache backend under its key parts. Put
+# everything the block depends on in the key (ids and updated_at): entries
+# are never invalidated, they just stop being asked for.
+#----------------------------------------------------------------------------#
+
+class AtomicFileSystemBytecodeCache(FileSystemBytecodeCache):
+    # Workers share the directory: never let one read a half written file.
+
+    def dump_bytecode(self, bucket):
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            bucket.write_bytecode(f)
+        os.replace(tmp, self._get_cache_filename(bucket))
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        Extension.__init__(self, environment)
+        environment.extend(fragment_cache_ttl=3600)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cached', [nodes.List(parts)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _cached(self, parts, caller):
+        backend = response_cache.backend
+        # A missing key part would make unrelated fragments share an entry.
+        if backend is None or any(isinstance(part, Undefined) for part in parts):
+            return caller()
+        key = 'fragment|' + '|'.join(str(part) for part in parts)
+        entry = backend.get(key)
+        if entry is not None and entry[0] > time.time():
+            return Markup(entry[2].decode('utf-8'))
+        body = caller()
+        backend.set(key, (time.time() + self.environment.fragment_cache_ttl, 'text/html',
+                          body.encode('utf-8')))
+        return body
+
+
+def precompile(app):
+    # Returns the number of templates compiled (or loaded from bytecode).
+    env = app.jinja_env
+    names = env.list_templates(extensions=('html',))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+class Templates(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Call once the filters are registered: templates using an unknown
+        # filter do not compile.
+        app.config.setdefault('TEMPLATE_BYTECODE_DIR', None)
+        app.config.setdefault('TEMPLATE_PRECOMPILE', False)
+        app.config.setdefault('FRAGMENT_CACHE_TTL', 3600)
+        env = app.jinja_env
+        env.add_extension(FragmentCacheExtension)
+        env.fragment_cache_ttl = app.config['FRAGMENT_CACHE_TTL']
+        if app.config['TEMPLATE_BYTECODE_DIR']:
+            os.makedirs(app.config['TEMPLATE_BYTECODE_DIR'], exist_ok=True)
+            env.bytecode_cache = AtomicFileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_DIR'])
+        if app.config['TEMPLATE_PRECOMPILE']:
+            precompile(app)
+        app.cli.add_command(precompile_command)
+
+
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_command():
+    """Compile every template into the bytecode cache."""
+    started = time.perf_counter()
+    count = precompile(current_app)
+    click.echo('Compiled {} templates in {:.0f} ms.'.format(count, (time.perf_counter() - started) * 1000))
+
+
+templates = Templates()
@@ -0,0 +1,111 @@
+import os
+import sys
+from datetime import datetime
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The suite runs against its own database, emptied at the start: never the
+# one in DATABASE_URL. config.py reads the environment on import.
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+# One process: the per-process cache sees every invalidation.
+os.environ['RESPONSE_CACHE_BACKEND'] = 'lru'
+
+ADMIN_TOKEN = 'test-admin-token'
+ADMIN_HEADERS = {'X-Admin-Token': ADMIN_TOKEN}
+
+
+def _create_schema(db):
+    # The trigram indexes of the search need pg_trgm: without it the schema
+    # is built without them, and the tests of the search are skipped.
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        trigrams = True
+    except SQLAlchemyError:
+        trigrams = False
+        for table in db.metadata.tables.values():
+            table.indexes = {index for index in table.indexes if not index.name.endswith('_trgm')}
+    db.drop_all()
+    db.create_all()
+    return trigrams
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    from app import create_app
+    from models import db
+    app = create_app()
+    app.config.update(TESTING=True, ADMIN_TOKEN=ADMIN_TOKEN)
+    with app.app_context():
+        app.config['PG_TRGM'] = _create_schema(db)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def database(request):
+    # Empty tables and cache for every test that uses the app.
+    if 'app' not in request.fixturenames:
+        yield None
+        return
+    app = request.getfixturevalue('app')
+    from cache import response_cache
+    from models import db, CounterRollover
+    with app.app_context():
+        db.session.execute(text('TRUNCATE "Show", "Venue", "Artist", "CounterRollover" RESTART IDENTITY'))
+        db.session.add(CounterRollover(id=1, rolled_at=datetime.now()))
+        db.session.commit()
+        response_cache.backend.clear()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def search(app):
+    if not app.config['PG_TRGM']:
+        pytest.skip('pg_trgm is not installed')
+
+
+@pytest.fixture
+def make_venue(app, database):
+    from models import Venue
+
+    def make(**values):
+        venue = Venue(**dict({
+            'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+            'phone': '123-123-1234', 'genres': ['Jazz'], 'facebook_link': 'https://www.facebook.com/TheMusicalHop',
+            'website': 'https://www.themusicalhop.com', 'seeking_talent': True,
+            'seeking_description': 'Looking for local artists',
+        }, **values))
+        database.session.add(venue)
+        database.session.commit()
+        return venue
+    return make
+
+
+@pytest.fixture
+def make_artist(app, database):
+    from models import Artist
+
+    def make(**values):
+        artist = Artist(**dict({
+            'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA', 'phone': '326-123-5000',
+            'genres': ['Rock n Roll'], 'facebook_link': 'https://www.facebook.com/GunsNPetals',
+            'website': 'https://www.gunsnpetalsband.com', 'seeking_venue': False,
+        }, **values))
+        database.session.add(artist)
+        database.session.commit()
+        return artist
+    return make
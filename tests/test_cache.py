@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+from cache import DiskBackend
+
+
+def test_disk_backend_prunes_by_size(tmp_path):
+    backend = DiskBackend(str(tmp_path), max_entries=100, max_bytes=1000)
+    backend.PRUNE_EVERY = 1
+    for i in range(5):
+        backend.set('page {}'.format(i), (0, 'text/html', b'x' * 300))
+    assert backend.get('page 4') is not None
+    assert backend.get('page 0') is None
+    assert sum(1 for i in range(5) if backend.get('page {}'.format(i))) == 3
+    # A body above the limit is not stored at all
+    backend.set('page 5', (0, 'text/html', b'x' * 1001))
+    assert backend.get('page 5') is None
+
+
+def test_bookings_refresh_the_listings_counters(client, make_venue, make_artist):
+    venue_id, artist_id = make_venue().id, make_artist().id
+    assert client.get('/api/v1/venues').get_json()['data'][0]['upcoming_shows_count'] == 0
+    assert client.get('/api/v1/artists').headers['X-Cache'] == 'MISS'
+    client.post('/shows/create', data={
+        'venue_id': venue_id, 'artist_id': artist_id, 'duration': 120,
+        'start_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')})
+    assert client.get('/api/v1/venues').get_json()['data'][0]['upcoming_shows_count'] == 1
+    assert client.get('/api/v1/artists').get_json()['data'][0]['upcoming_shows_count'] == 1
@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from conftest import ADMIN_HEADERS
+from exporter import Exporter
+from models import db, Artist
+
+
+def exported_ids(exporter):
+    return [json.loads(line)['id'] for line in b''.join(exporter.chunks()).splitlines()]
+
+
+def test_incremental_export_takes_new_and_changed_rows(make_artist):
+    ids = [make_artist(name='Artist {}'.format(i)).id for i in range(4)]
+    now = datetime.now()
+    last_run = now - timedelta(minutes=30)
+    db.session.execute(Artist.__table__.update().values(updated_at=now - timedelta(hours=1)))
+    # Changed since the last run, which ended at ids[2]
+    db.session.execute(Artist.__table__.update().where(Artist.id == ids[0])
+                       .values(updated_at=now - timedelta(minutes=10)))
+    db.session.commit()
+
+    exporter = Exporter('artists', 'ndjson', after_id=ids[2], updated_since=last_run)
+    assert exported_ids(exporter) == [ids[0], ids[3]]
+    assert exporter.watermarks()['after_id'] == ids[3]
+    assert exported_ids(Exporter('artists', 'ndjson', updated_since=last_run)) == [ids[0]]
+    assert exported_ids(Exporter('artists', 'ndjson', after_id=ids[2])) == [ids[3]]
+
+
+def test_export_leaves_recent_changes_to_the_next_run(make_artist):
+    artist = make_artist()
+    db.session.execute(Artist.__table__.update().values(updated_at=datetime.now() - timedelta(seconds=30)))
+    db.session.commit()
+    exporter = Exporter('artists', 'ndjson', updated_since=datetime.now() - timedelta(hours=1), lag=60)
+    assert exported_ids(exporter) == []
+    assert exported_ids(Exporter('artists', 'ndjson', updated_since=exporter.watermarks()['updated_since'])) \
+        == [artist.id]
+
+
+def test_export_download(client, make_venue):
+    make_venue(genres=['Jazz', 'Folk'])
+    assert client.get('/export/venues').status_code == 401
+    response = client.get('/export/venues?format=csv', headers=ADMIN_HEADERS)
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['genres'] for row in rows] == ['Jazz;Folk']
+    assert int(response.headers['X-Export-After-Id']) == int(rows[0]['id'])
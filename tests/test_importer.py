@@ -0,0 +1,47 @@
+import io
+from conftest import ADMIN_HEADERS
+from models import Venue, Show
+
+
+def upload(client, kind, content, filename, headers=ADMIN_HEADERS):
+    return client.post('/import/' + kind, headers=headers,
+                       data={'file': (io.BytesIO(content.encode('utf-8')), filename)})
+
+
+VENUES_CSV = '''name,city,state,address,phone,genres,facebook_link,website,seeking_talent,seeking_description
+The Dueling Pianos Bar,New York,NY,335 Delancey Street,914-003-1132,Classical;Jazz,https://www.facebook.com/theduelingpianos,https://www.theduelingpianos.com,No,
+,New York,NY,1 Main Street,914-003-1133,Jazz,https://www.facebook.com/x,https://www.x.com,No,
+Park Square Live Music & Coffee,San Francisco,ZZ,34 Whiskey Moore Ave,415-000-1234,Folk,https://www.facebook.com/y,https://www.y.com,Yes,Local acts
+'''
+
+
+def test_import_reports_rejected_rows(client, database):
+    response = upload(client, 'venues', VENUES_CSV, 'venues.csv')
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['inserted'] == 1
+    assert report['failed'] == 2
+    assert [error['line'] for error in report['errors']] == [3, 4]
+    assert 'name' in report['errors'][0]['errors']
+    assert 'state' in report['errors'][1]['errors']
+    venue = Venue.query.one()
+    assert venue.genres == ['Classical', 'Jazz']
+    assert venue.seeking_talent is False
+
+
+def test_import_reports_unknown_references(client, database, make_venue, make_artist):
+    venue, artist = make_venue(), make_artist()
+    shows = ('{{"venue_id": {0}, "artist_id": {1}, "start_time": "2035-05-21 21:30:00"}}\n'
+             'not json\n'
+             '{{"venue_name": "Nowhere", "artist_id": {1}, "start_time": "2035-05-22 21:30:00"}}\n'
+             '{{"venue_id": {0}, "artist_id": {1}, "start_time": "2035-05-21 21:45:00"}}\n').format(venue.id, artist.id)
+    report = upload(client, 'shows', shows, 'shows.ndjson').get_json()
+    assert report['inserted'] == 1
+    assert [error['line'] for error in report['errors']] == [2, 3, 4]
+    assert 'venue' in report['errors'][1]['errors']
+    assert Show.query.count() == 1
+
+
+def test_import_requires_the_admin_token(client, database):
+    assert upload(client, 'venues', VENUES_CSV, 'venues.csv', headers={}).status_code == 401
+    assert Venue.query.count() == 0
@@ -0,0 +1,29 @@
+from instrumentation import RequestStats
+
+SELECT = 'SELECT * FROM "Venue" WHERE id = %(id)s'
+
+
+def test_repeated_statements_are_counted():
+    stats = RequestStats(repeats=5)
+    for i in range(20):
+        stats.record(SELECT, {'id': i}, 0.001)
+    stats.record('SELECT 1', {}, 0.001)
+    assert stats.repeated() == [(SELECT, 20)]
+    # Only as many parameter sets as it takes to tell, and as hashes
+    assert stats._seen[SELECT] == {hash(repr({'id': i})) for i in range(5)}
+
+
+def test_same_parameters_are_not_an_n_plus_one():
+    stats = RequestStats(repeats=5)
+    for i in range(20):
+        stats.record(SELECT, {'id': 1}, 0.001)
+    assert stats.repeated() == []
+
+
+def test_executemany_parameters_are_not_kept():
+    stats = RequestStats(repeats=5)
+    rows = [{'name': 'Venue {}'.format(i)} for i in range(1000)]
+    for i in range(10):
+        stats.record('INSERT INTO "Venue" (name) VALUES (%(name)s)', rows, 0.01, executemany=True)
+    assert stats.statements == 10
+    assert stats.repeated() == [] and not stats._seen
@@ -0,0 +1,28 @@
+import json
+import logging
+import os
+from logs import json_file_handler
+
+
+def record(message):
+    return logging.LogRecord('fyyur', logging.INFO, __file__, 1, message, None, None)
+
+
+def lines(path):
+    with open(path) as f:
+        return [json.loads(line)['message'] for line in f]
+
+
+def test_workers_reopen_the_log_once_it_is_rotated(tmp_path):
+    path = str(tmp_path / 'fyyur.log')
+    # The handlers of two workers, on the same file
+    workers = [json_file_handler(path, max_bytes=0), json_file_handler(path, max_bytes=0)]
+    workers[0].emit(record('before 0'))
+    workers[1].emit(record('before 1'))
+    os.rename(path, path + '.1')
+    workers[0].emit(record('after 0'))
+    workers[1].emit(record('after 1'))
+    for handler in workers:
+        handler.close()
+    assert lines(path + '.1') == ['before 0', 'before 1']
+    assert lines(path) == ['after 0', 'after 1']
@@ -0,0 +1,22 @@
+import pytest
+from benchmarks.seed import seed
+from cache import response_cache
+from plans import check_plans, hot_requests, sample_arguments
+
+
+@pytest.fixture
+def catalog(database):
+    seed(venues=300, artists=300, shows=3000, areas=10)
+
+
+def test_hot_views_use_indexes(app, catalog):
+    requests = hot_requests(sample_arguments())
+    if not app.config['PG_TRGM']:
+        requests = [request for request in requests if not request[1].endswith('/search')]
+    # Cached pages would issue no queries at all.
+    backend, response_cache.backend = response_cache.backend, None
+    try:
+        failures = check_plans(min_rows=0, force_indexes=True, requests=requests)
+    finally:
+        response_cache.backend = backend
+    assert [(request, tables) for request, _, tables in failures] == []
@@ -0,0 +1,11 @@
+from conftest import ADMIN_HEADERS
+
+
+def test_profiles_stay_under_the_profiler_dir(app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILER_DIR', str(tmp_path / 'profiles'))
+    (tmp_path / 'profiles' / 'pages.shows').mkdir(parents=True)
+    (tmp_path / 'profiles' / 'pages.shows' / '1.collapsed').write_text('app:index;app:render 3\n')
+    (tmp_path / 'outside.collapsed').write_text('secret 1\n')
+    assert client.get('/admin/profiles/pages.shows', headers=ADMIN_HEADERS).data == b'app:index;app:render 3\n'
+    for endpoint in ('..', '.', '..%2F..'):
+        assert client.get('/admin/profiles/' + endpoint, headers=ADMIN_HEADERS).status_code == 404
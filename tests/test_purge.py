@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+import counters
+from models import db, Venue, Artist, Show
+from purge import remove_venue, purge_deleted
+
+
+def add_show(venue_id, artist_id, start_time):
+    show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time, end_time=start_time + timedelta(hours=2))
+    db.session.add(show)
+    db.session.flush()
+    counters.record_show(show.id)
+    db.session.commit()
+    return show.id
+
+
+def test_soft_delete_hides_the_venue_until_the_purge(client, make_venue, make_artist):
+    venue_id, artist_id = make_venue().id, make_artist().id
+    past_id = add_show(venue_id, artist_id, datetime.now() - timedelta(days=30))
+    add_show(venue_id, artist_id, datetime.now() + timedelta(days=30))
+    assert b'The Musical Hop' in client.get('/artists/{}'.format(artist_id)).data
+
+    client.delete('/venues/{}'.format(venue_id))
+    assert Venue.query.get(venue_id).deleted_at is not None
+    # The past show stays until the purge; the cached artist page is gone
+    assert [show.id for show in Show.query] == [past_id]
+    assert client.get('/venues/{}'.format(venue_id)).status_code == 404
+    assert client.get('/api/v1/venues/{}'.format(venue_id)).status_code == 404
+    assert b'The Musical Hop' not in client.get('/artists/{}'.format(artist_id)).data
+    assert Artist.query.get(artist_id).upcoming_shows_count == 0
+
+    assert purge_deleted(batch_size=1) == (1, 1)
+    assert Venue.query.count() == 0 and Show.query.count() == 0
+    assert Artist.query.get(artist_id) is not None
+
+
+def test_hard_delete_cascades_to_the_shows(make_venue, make_artist):
+    venue_id, artist_id = make_venue().id, make_artist().id
+    add_show(venue_id, artist_id, datetime.now() + timedelta(days=1))
+    remove_venue(venue_id, soft=False)
+    db.session.commit()
+    assert Venue.query.count() == 0 and Show.query.count() == 0
+    assert Artist.query.get(artist_id).upcoming_shows_count == 0
+
+
+def test_deleted_venues_are_not_found_by_the_search(client, search, make_venue):
+    make_venue(name='The Kept Hall')
+    gone_id = make_venue(name='The Gone Hall').id
+    client.delete('/venues/{}'.format(gone_id))
+    response = client.post('/venues/search', data={'search_term': 'hall'})
+    assert b'The Kept Hall' in response.data
+    assert b'The Gone Hall' not in response.data
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from models import Show
+
+
+def create_show(client, venue_id, artist_id, start_time, duration=120):
+    return client.post('/shows/create', data={
+        'venue_id': venue_id, 'artist_id': artist_id, 'duration': duration,
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')})
+
+
+def test_double_bookings_are_rejected(client, make_venue, make_artist):
+    venue_id, other_venue_id, artist_id = make_venue().id, make_venue(name='Other').id, make_artist().id
+    start = datetime.now().replace(microsecond=0) + timedelta(days=7)
+    assert create_show(client, venue_id, artist_id, start).status_code == 200
+    # The artist is still on stage at the other venue
+    response = create_show(client, other_venue_id, artist_id, start + timedelta(minutes=90))
+    assert response.status_code == 409
+    assert b'Guns N Petals is already booked' in response.data
+    # Back to back is fine
+    assert create_show(client, venue_id, artist_id, start + timedelta(minutes=120)).status_code == 200
+    assert Show.query.count() == 2
+
+
+def test_show_counters_follow_new_shows(client, make_venue, make_artist):
+    venue_id, artist_id = make_venue().id, make_artist().id
+    create_show(client, venue_id, artist_id, datetime.now() + timedelta(days=1))
+    create_show(client, venue_id, artist_id, datetime.now() - timedelta(days=1))
+    response = client.get('/api/v1/venues/{}'.format(venue_id)).get_json()
+    assert (response['upcoming_shows_count'], response['past_shows_count']) == (1, 1)
+
+
+def test_shows_of_deleted_venues_do_not_block_bookings(client, make_venue, make_artist):
+    venue_id, other_venue_id, artist_id = make_venue().id, make_venue(name='Other').id, make_artist().id
+    past = datetime.now().replace(microsecond=0) - timedelta(days=7)
+    assert create_show(client, venue_id, artist_id, past).status_code == 200
+    client.delete('/venues/{}'.format(venue_id))
+    assert create_show(client, other_venue_id, artist_id, past + timedelta(minutes=30)).status_code == 200
+    # Nor are they named in the conflicts of another booking
+    response = create_show(client, other_venue_id, artist_id, past + timedelta(minutes=60))
+    assert response.status_code == 409
+    assert b'The Musical Hop' not in response.data and b'Other' in response.data
@@ -0,0 +1,89 @@
+import json
+import threading
+from conftest import ADMIN_HEADERS
+from models import db, Venue, Artist
+
+
+def patch(client, kind, items, headers=ADMIN_HEADERS):
+    return client.patch('/api/v1/' + kind, data=json.dumps(items),
+                        headers=dict(headers, **{'Content-Type': 'application/json'}))
+
+
+def test_batch_reports_each_update(client, make_venue):
+    fresh, stale, deleted = make_venue(), make_venue(name='Stale'), make_venue(name='Gone')
+    db.session.execute(Venue.__table__.update().where(Venue.id == deleted.id).values(deleted_at=db.func.now()))
+    db.session.commit()
+    response = patch(client, 'venues', [
+        {'id': fresh.id, 'version': 1, 'phone': '555-000-1111', 'city': 'New York', 'state': 'NY'},
+        {'id': stale.id, 'version': 7, 'name': 'Lost update'},
+        {'id': deleted.id, 'version': 1, 'name': 'Back'},
+        {'id': 9999, 'version': 1, 'name': 'Nobody'},
+        {'id': fresh.id, 'version': 1, 'name': 'Twice'},
+        {'id': stale.id, 'version': 1, 'state': 'ZZ', 'website': 'nope', 'version_id': 3},
+    ])
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert results[0] == {'id': fresh.id, 'status': 'updated', 'version': 2}
+    assert results[1] == {'id': stale.id, 'status': 'conflict', 'version': 1}
+    assert results[2]['status'] == results[3]['status'] == 'not_found'
+    assert results[4]['status'] == 'invalid'
+    assert set(results[5]['errors']) == {'state', 'website', 'version_id'}
+
+    venue = Venue.query.get(fresh.id)
+    assert (venue.phone, venue.city, venue.version) == ('555-000-1111', 'New York', 2)
+    assert venue.latitude is not None
+    assert Venue.query.get(stale.id).name == 'Stale'
+
+
+def test_null_clears_optional_fields_only(client, make_artist):
+    artist = make_artist(seeking_description='Anywhere')
+    results = patch(client, 'artists', [{'id': artist.id, 'version': 1, 'website': None,
+                                         'seeking_description': None, 'seeking_venue': False}]).get_json()['results']
+    assert results[0]['status'] == 'updated'
+    artist = Artist.query.get(artist.id)
+    assert artist.website is None and artist.seeking_description is None
+    results = patch(client, 'artists', [{'id': artist.id, 'version': 2, 'name': None}]).get_json()['results']
+    assert results[0]['errors'] == {'name': ['This field is required.']}
+
+
+def test_edits_bump_the_version(client, make_venue):
+    venue = make_venue()
+    venue.phone = '555-000-2222'
+    db.session.commit()
+    assert venue.version == 2
+    results = patch(client, 'venues', [{'id': venue.id, 'version': 1, 'name': 'Overwrite'}]).get_json()['results']
+    assert results[0] == {'id': venue.id, 'status': 'conflict', 'version': 2}
+
+
+def test_batch_invalidates_cached_pages(client, make_venue):
+    venue = make_venue()
+    assert client.get('/venues/{}'.format(venue.id)).headers['X-Cache'] == 'MISS'
+    assert client.get('/venues/{}'.format(venue.id)).headers['X-Cache'] == 'HIT'
+    patch(client, 'venues', [{'id': venue.id, 'version': 1, 'name': 'The Renamed Hop'}])
+    response = client.get('/venues/{}'.format(venue.id))
+    assert response.headers['X-Cache'] == 'MISS'
+    assert b'The Renamed Hop' in response.data
+
+
+def test_concurrent_batches_on_the_same_version(app, make_venue):
+    ids = [make_venue(name='Venue {}'.format(i)).id for i in range(50)]
+    db.session.remove()
+    counts = []
+
+    def sync(name):
+        counts.append(patch(app.test_client(), 'venues', [
+            {'id': venue_id, 'version': 1, 'name': name} for venue_id in ids]).get_json()['counts'])
+
+    threads = [threading.Thread(target=sync, args=(name,)) for name in ('A', 'B')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(counts, key=lambda count: 'conflict' in count) == [{'updated': 50}, {'conflict': 50}]
+    assert {name for name, in db.session.query(Venue.name)} in ({'A'}, {'B'})
+
+
+def test_batch_requires_the_admin_token(client, make_venue):
+    venue = make_venue()
+    assert patch(client, 'venues', [{'id': venue.id, 'version': 1, 'name': 'X'}], headers={}).status_code == 401
+    assert patch(client, 'venues', {'id': venue.id}).status_code == 400
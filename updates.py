@@ -0,0 +1,250 @@
+from datetime import datetime
+from flask import Blueprint, abort, current_app, request
+from sqlalchemy import ARRAY, text
+from sqlalchemy.dialects import postgresql
+from api import json_response
+from auth import admin_required
+from cache import response_cache, venue_tags, artist_tags
+from forms import VenueForm, ArtistForm
+from geocoding import gazetteer
+from importer import form_data
+from models import db, Venue, Artist
+
+
+#----------------------------------------------------------------------------#
+# Batch updates.
+#
+# A PATCH of /api/v1/venues or /api/v1/artists is a JSON list of partial
+# updates, each naming the version of the row it was made against:
+#
+#     [{"id": 4, "version": 2, "phone": "326-123-5000"}, ...]
+#
+# The whole batch is applied in one transaction, without loading a row:
+# one UPDATE ... FROM (VALUES ...) per set of changed fields, which only
+# touches a row still at the given version and bumps it. An item whose row
+# has moved on since is reported as a conflict, with the current version,
+# and the rest of the batch goes through. Fields are validated like those
+# of the create forms.
+#----------------------------------------------------------------------------#
+
+updates = Blueprint('updates', __name__)
+
+# model, form, fields an update may set
+KINDS = {
+    'venues': (Venue, VenueForm, ('name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+                                  'facebook_link', 'website', 'seeking_talent', 'seeking_description')),
+    'artists': (Artist, ArtistForm, ('name', 'city', 'state', 'phone', 'genres', 'image_link',
+                                     'facebook_link', 'website', 'seeking_venue', 'seeking_description')),
+}
+
+# JSON booleans, where the forms have Yes/No
+BOOLEAN_FIELDS = ('seeking_talent', 'seeking_venue')
+
+
+def _integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_item(kind, item):
+    # (id, version, {column: value}, errors) of one item of a batch.
+    if not isinstance(item, dict):
+        return None, None, {}, {'item': ['Not a JSON object.']}
+    model, form_class, fields = KINDS[kind]
+    entity_id, version = item.get('id'), item.get('version')
+    errors = {}
+    for name in ('id', 'version'):
+        if not _integer(item.get(name)):
+            errors[name] = ['An integer is required.']
+    for name in item:
+        if name not in fields and name not in ('id', 'version'):
+            errors[name] = ['Unknown or read-only field.']
+
+    changes = {name: item[name] for name in fields if name in item}
+    form = form_class(formdata=form_data(changes), meta={'csrf': False})
+    values = {}
+    for name, value in changes.items():
+        if name in BOOLEAN_FIELDS:
+            if isinstance(value, bool):
+                values[name] = value
+            else:
+                errors[name] = ['true or false is required.']
+            continue
+        field = form[name]
+        # null clears the fields the forms don't require
+        if value is None and not field.flags.required:
+            values[name] = None
+            continue
+        if not field.validate(form):
+            errors[name] = field.errors
+            continue
+        column_type = model.__table__.c[name].type
+        strings = field.data if isinstance(column_type, ARRAY) else [field.data]
+        length = getattr(getattr(column_type, 'item_type', column_type), 'length', None)
+        if length and any(len(string) > length for string in strings):
+            errors[name] = ['At most {} characters.'.format(length)]
+            continue
+        values[name] = field.data
+    if not changes and not errors:
+        errors['item'] = ['Nothing to update.']
+    return entity_id, version, values, errors
+
+
+def update_rows(model, columns, rows, versioned=True):
+    # Sets columns from rows of (id, version, *values), or (id, *values)
+    # when not versioned, in one statement. Versioned rows are only updated
+    # at the given version, which is bumped. Returns the (id, version, city,
+    # state) of the rows updated.
+    table = model.__table__
+    dialect = postgresql.dialect()
+    names = ['id'] + (['version'] if versioned else []) + list(columns)
+    # Cast, or a column of NULLs would be text
+    types = [table.c[name].type.compile(dialect=dialect) for name in names]
+    values, params = [], {}
+    for i, row in enumerate(rows):
+        values.append('({})'.format(', '.join(
+            'CAST(:{}_{} AS {})'.format(name, i, type_) for name, type_ in zip(names, types))))
+        params.update(('{}_{}'.format(name, i), value) for name, value in zip(names, row))
+    assignments = ['{0} = v.{0}'.format(name) for name in columns]
+    conditions = ['"{}".id = v.id'.format(table.name), str(model.listed().compile(dialect=dialect))]
+    if versioned:
+        assignments += ['version = "{}".version + 1'.format(table.name), 'updated_at = :updated_at']
+        conditions.append('"{}".version = v.version'.format(table.name))
+        params['updated_at'] = datetime.now()
+    return db.session.execute(text('''
+        UPDATE "{table}" SET {assignments}
+          FROM (VALUES {values}) AS v ({names})
+         WHERE {conditions}
+     RETURNING "{table}".id, "{table}".version, "{table}".city, "{table}".state
+    '''.format(table=table.name, assignments=', '.join(assignments), values=', '.join(values),
+               names=', '.join(names), conditions=' AND '.join(conditions))), params).fetchall()
+
+
+def apply_updates(kind, items):
+    # The result of every item, in order, and the ids updated. Call inside
+    # the transaction of the batch.
+    model = KINDS[kind][0]
+    results = [None] * len(items)
+    # columns -> [(index, id, version, values)]
+    groups = {}
+    seen = set()
+    for index, item in enumerate(items):
+        entity_id, version, values, errors = parse_item(kind, item)
+        if not errors and entity_id in seen:
+            errors = {'id': ['Updated twice in the batch.']}
+        if errors:
+            results[index] = {'id': entity_id, 'status': 'invalid', 'errors': errors}
+            continue
+        seen.add(entity_id)
+        groups.setdefault(tuple(sorted(values)), []).append((index, entity_id, version, values))
+
+    updated, moved = {}, []
+    for columns, group in groups.items():
+        rows = update_rows(model, columns, [
+            (entity_id, version) + tuple(values[name] for name in columns)
+            for _, entity_id, version, values in group])
+        updated.update((row.id, row) for row in rows)
+        if model is Venue and ('city' in columns or 'state' in columns):
+            moved += rows
+    if moved:
+        update_rows(Venue, ('latitude', 'longitude'), [
+            (row.id,) + tuple(gazetteer.locate(row.city, row.state)) for row in moved], versioned=False)
+
+    missing = [entity_id for group in groups.values() for _, entity_id, _, _ in group if entity_id not in updated]
+    current = dict(db.session.query(model.id, model.version)
+                   .filter(model.id.in_(missing), model.listed())) if missing else {}
+    for group in groups.values():
+        for index, entity_id, _, _ in group:
+            if entity_id in updated:
+                results[index] = {'id': entity_id, 'status': 'updated', 'version': updated[entity_id].version}
+            elif entity_id in current:
+                results[index] = {'id': entity_id, 'status': 'conflict', 'version': current[entity_id]}
+            else:
+                results[index] = {'id': entity_id, 'status': 'not_found'}
+    return results, list(updated)
+
+
+def _batch(kind):
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        abort(400, 'The body must be a JSON list of updates')
+    if len(items) > current_app.config['BATCH_UPDATE_MAX_ITEMS']:
+        abort(400, 'At most {} updates per batch'.format(current_app.config['BATCH_UPDATE_MAX_ITEMS']))
+    results, ids = apply_updates(kind, items)
+    tags = (venue_tags if kind == 'venues' else artist_tags)(*ids) if ids else []
+    db.session.commit()
+    response_cache.invalidate(*tags)
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return json_response({'counts': counts, 'results': results})
+
+
+@updates.route('/api/v1/venues', methods=['PATCH'])
+@admin_required
+def update_venues():
+    """
+    Update many venues at once
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: body
+        in: body
+        required: true
+        description: >
+          A list of partial updates, each with the venue's id and the version
+          it was read at, e.g. [{"id": 4, "version": 2, "phone": "326-123-5000"}]
+        schema:
+          type: array
+          items:
+            type: object
+    responses:
+      200:
+        description: >
+          The result of every update, in order: updated (with the new
+          version), conflict (with the current version), not_found or invalid
+          (with the errors)
+      400:
+        description: Not a JSON list, or more than BATCH_UPDATE_MAX_ITEMS updates
+      401:
+        description: Missing or wrong X-Admin-Token
+    """
+    return _batch('venues')
+
+
+@updates.route('/api/v1/artists', methods=['PATCH'])
+@admin_required
+def update_artists():
+    """
+    Update many artists at once
+    ---
+    tags:
+      - Fyyur API
+    parameters:
+      - name: body
+        in: body
+        required: true
+        description: >
+          A list of partial updates, each with the artist's id and the version
+          it was read at, e.g. [{"id": 4, "version": 2, "seeking_venue": false}]
+        schema:
+          type: array
+          items:
+            type: object
+    responses:
+      200:
+        description: >
+          The result of every update, in order: updated (with the new
+          version), conflict (with the current version), not_found or invalid
+          (with the errors)
+      400:
+        description: Not a JSON list, or more than BATCH_UPDATE_MAX_ITEMS updates
+      401:
+        description: Missing or wrong X-Admin-Token
+    """
+    return _batch('artists')
+
+
+@updates.errorhandler(400)
+def update_error(error):
+    return json_response({'error': error.description}, status=error.code)